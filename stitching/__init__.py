@@ -1,3 +1,4 @@
-from .stitcher import AffineStitcher, Stitcher  # noqa: F401
+from .incremental_stitcher import IncrementalStitcher  # noqa: F401
+from .stitcher import AffineStitcher, Stitcher, TranslationStitcher  # noqa: F401
 
 __version__ = "0.7.0"
@@ -1,6 +1,8 @@
 import cv2 as cv
 import numpy as np
 
+from .cropper import Cropper, Rectangle, get_intersection, grow
+
 
 class Blender:
     """https://docs.opencv.org/4.x/d6/d4a/classcv_1_1detail_1_1Blender.html"""
@@ -19,10 +21,17 @@ class Blender:
         self.blender_type = blender_type
         self.blend_strength = blend_strength
         self.blender = None
+        self.blend_width = None
+        self.buffer = Int16Buffer()
 
     def prepare(self, corners, sizes):
         dst_sz = cv.detail.resultRoi(corners=corners, sizes=sizes)
-        blend_width = np.sqrt(dst_sz[2] * dst_sz[3]) * self.blend_strength / 100
+        self.prepare_roi(dst_sz, self.get_blend_width(dst_sz))
+
+    def prepare_roi(self, dst_sz, blend_width):
+        """Prepares the blending of the region dst_sz (x, y, width, height)
+        of a panorama with the given blend width"""
+        self.blend_width = blend_width
 
         if self.blender_type == "no" or blend_width < 1:
             self.blender = cv.detail.Blender_createDefault(cv.detail.Blender_NO)
@@ -37,15 +46,62 @@ class Blender:
 
         self.blender.prepare(dst_sz)
 
+    def get_blend_width(self, dst_sz):
+        return np.sqrt(dst_sz[2] * dst_sz[3]) * self.blend_strength / 100
+
+    def align_to_pyramid(self, roi, panorama_corner):
+        """The multiband blender aligns its pyramids to the corner of the
+        blended region, so a region of a panorama has to start on the
+        panorama's grid to get the same pyramids"""
+        if self.blender_type != "multiband" or self.blend_width < 1:
+            return roi
+        step = 1 << max(int(np.log(self.blend_width) / np.log(2.0) - 1.0), 0)
+        x = roi.x - (roi.x - panorama_corner[0]) % step
+        y = roi.y - (roi.y - panorama_corner[1]) % step
+        return Rectangle(x, y, roi.x2 - x, roi.y2 - y)
+
     def feed(self, img, mask, corner):
-        self.blender.feed(cv.UMat(img.astype(np.int16)), mask, corner)
+        """Only the bounding box of the mask, grown by the margin the blender
+        reads around the mask, is fed. After the seam finding this is often
+        only a strip of the image. The multiband blender widens uint8 images
+        itself, the other blenders need int16 images"""
+        if isinstance(mask, cv.UMat):
+            mask = cv.UMat.get(mask)
+        x, y, width, height = cv.boundingRect(mask)
+        if width == 0:
+            return
+        roi = get_intersection(
+            grow(Rectangle(x, y, width, height), self.get_feed_margin()),
+            Rectangle(0, 0, *mask.shape[::-1]),
+        )
+        img = Cropper.crop_rectangle(img, roi)
+        mask = np.ascontiguousarray(Cropper.crop_rectangle(mask, roi))
+        corner = (corner[0] + roi.x, corner[1] + roi.y)
+        if isinstance(self.blender, cv.detail_MultiBandBlender):
+            if img.dtype != np.uint8:
+                img = img.astype(np.int16)
+            self.blender.feed(img, mask, corner)
+        else:
+            self.blender.feed(self.buffer.widen(img), mask, corner)
+
+    def get_feed_margin(self):
+        """The pyramids of the multiband blender reach 3 * 2^bands pixels
+        (the border opencv adds to fed images) around the mask, the feather
+        weights need a black border"""
+        if isinstance(self.blender, cv.detail_MultiBandBlender):
+            return 3 << self.blender.numBands()
+        return 1
 
-    def blend(self):
-        result = None
-        result_mask = None
-        result, result_mask = self.blender.blend(result, result_mask)
-        result = cv.convertScaleAbs(result)
-        return result, result_mask
+    def blend(self, roi=None):
+        """The uint8 panorama and its mask. The result stays in opencv's
+        memory until it is converted. If roi (x, y, width, height relative to
+        the panorama) is given, only this part is converted and returned"""
+        result, result_mask = self.blender.blend(cv.UMat(), cv.UMat())
+        if roi is not None:
+            rows, cols = (roi.y, roi.y2), (roi.x, roi.x2)
+            result = cv.UMat(result, rows, cols)
+            result_mask = cv.UMat(result_mask, rows, cols)
+        return cv.convertScaleAbs(result).get(), result_mask.get()
 
     @classmethod
     def create_panorama(cls, imgs, masks, corners, sizes):
@@ -54,3 +110,18 @@ class Blender:
         for img, mask, corner in zip(imgs, masks, corners):
             blender.feed(img, mask, corner)
         return blender.blend()
+
+
+class Int16Buffer:
+    """Reusable memory for the int16 images opencv's blenders and timelapser
+    need, so that the uint8 images aren't copied into new arrays"""
+
+    def __init__(self):
+        self.buffer = np.empty(0, np.int16)
+
+    def widen(self, img):
+        if self.buffer.size < img.size:
+            self.buffer = np.empty(img.size, np.int16)
+        widened = self.buffer[: img.size].reshape(img.shape)
+        widened[...] = img
+        return widened
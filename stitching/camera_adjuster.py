@@ -1,9 +1,97 @@
-from collections import OrderedDict
+import time
+from collections import OrderedDict, namedtuple
 
 import cv2 as cv
 import numpy as np
 
+from .camera_estimator import TranslationEstimator
+from .camera_loader import CameraLoader
+from .feature_matcher import FeatureMatcher
+from .parallel import parallel_map
 from .stitching_error import StitchingError
+from .subsetter import Subsetter
+
+AdjustmentReport = namedtuple(
+    "AdjustmentReport", ["steps", "initial_error", "final_error", "elapsed"]
+)
+
+
+class TranslationAdjuster:
+    """Closed form least squares solution of the translations of all images
+    given the inlier matches of all pairs exceeding the confidence threshold.
+    The refinement mask is not used."""
+
+    def __init__(self):
+        self.conf_thresh = 1.0
+
+    def setConfThresh(self, conf_thresh):
+        self.conf_thresh = conf_thresh
+
+    def setRefinementMask(self, mask):
+        pass
+
+    def setTermCriteria(self, term_criteria):
+        pass
+
+    def apply(self, features, pairwise_matches, cameras):
+        nr_imgs = len(cameras)
+        rows, offsets, weights = [], [], []
+        for idx, match in enumerate(pairwise_matches):
+            i, j = divmod(idx, nr_imgs)
+            if i < j and match.confidence > self.conf_thresh:
+                row = np.zeros(nr_imgs)
+                row[i], row[j] = -1, 1
+                rows.append(row)
+                offsets.append(match.H[:2, 2])
+                weights.append(np.sqrt(match.num_inliers))
+        if len(rows) < nr_imgs - 1:
+            return False, cameras
+
+        weights = np.array(weights)[:, np.newaxis]
+        A, b = np.array(rows) * weights, np.array(offsets) * weights
+        translations, _, rank, _ = np.linalg.lstsq(A, b, rcond=None)
+        if rank < nr_imgs - 1:
+            return False, cameras
+        # keep the position of the panorama of the initial cameras
+        initial = np.array([camera.R[:2, 2] for camera in cameras])
+        translations += np.mean(initial - translations, axis=0)
+        return True, [TranslationEstimator.create_camera(t) for t in translations]
+
+
+class ReprojectionError:
+    """Root mean square distance (in pixels) between the inlier keypoints of
+    the matches exceeding the confidence threshold and their projections"""
+
+    def __init__(self, features, pairwise_matches, confidence_threshold, affine):
+        self.affine = affine
+        self.pairs = []
+        points = [cv.KeyPoint_convert(f.getKeypoints()) for f in features]
+        for idx, match in enumerate(pairwise_matches):
+            i, j = divmod(idx, len(features))
+            if i < j and match.confidence > confidence_threshold:
+                inliers = match.getInliers().astype(bool)
+                matches = match.getMatches()
+                src = points[i][[m.queryIdx for m in matches]][inliers]
+                dst = points[j][[m.trainIdx for m in matches]][inliers]
+                if len(src) > 0:
+                    self.pairs.append((i, j, src.astype(np.float64), dst))
+
+    def __call__(self, cameras):
+        if len(self.pairs) == 0:
+            return 0.0
+        squared_errors = []
+        for i, j, src, dst in self.pairs:
+            H = self.get_homography(cameras[i], cameras[j])
+            projected = cv.perspectiveTransform(src[:, np.newaxis], H)[:, 0]
+            squared_errors.append(np.sum((projected - dst) ** 2, axis=1))
+        return float(np.sqrt(np.mean(np.concatenate(squared_errors))))
+
+    def get_homography(self, camera1, camera2):
+        R1, R2 = camera1.R.astype(np.float64), camera2.R.astype(np.float64)
+        if self.affine:
+            # the affine estimator chains the cameras as R2 = R1 @ H
+            return np.linalg.inv(R1) @ R2
+        return camera2.K() @ np.linalg.inv(R2) @ R1 @ np.linalg.inv(camera1.K())
 
 
 class CameraAdjuster:
@@ -13,22 +101,74 @@ class CameraAdjuster:
     CAMERA_ADJUSTER_CHOICES["ray"] = cv.detail_BundleAdjusterRay
     CAMERA_ADJUSTER_CHOICES["reproj"] = cv.detail_BundleAdjusterReproj
     CAMERA_ADJUSTER_CHOICES["affine"] = cv.detail_BundleAdjusterAffinePartial
+    CAMERA_ADJUSTER_CHOICES["translation"] = TranslationAdjuster
     CAMERA_ADJUSTER_CHOICES["no"] = cv.detail_NoBundleAdjuster
 
     DEFAULT_CAMERA_ADJUSTER = list(CAMERA_ADJUSTER_CHOICES.keys())[0]
     DEFAULT_REFINEMENT_MASK = "xxxxx"
+    DEFAULT_CLUSTER_SIZE = -1
+    DEFAULT_MAX_ITERATIONS = 1000
+    DEFAULT_EPSILON = np.finfo(float).eps
+    DEFAULT_TIME_BUDGET = -1
+    DEFAULT_NR_WORKERS = 1
+    # opencv returns the untested first step if only one iteration is allowed
+    ITERATIONS_PER_STEP = 2
+    # of the joint refinement of the cluster alignment
+    MAX_ALIGNMENT_ITERATIONS = 100
+    ALIGNMENT_TOLERANCE = 1e-6
 
     def __init__(
         self,
         adjuster=DEFAULT_CAMERA_ADJUSTER,
         refinement_mask=DEFAULT_REFINEMENT_MASK,
         confidence_threshold=1.0,
+        cluster_size=DEFAULT_CLUSTER_SIZE,
+        max_iterations=DEFAULT_MAX_ITERATIONS,
+        epsilon=DEFAULT_EPSILON,
+        time_budget=DEFAULT_TIME_BUDGET,
+        nr_workers=DEFAULT_NR_WORKERS,
     ):
-        self.adjuster = CameraAdjuster.CAMERA_ADJUSTER_CHOICES[adjuster]()
-        self.set_refinement_mask(refinement_mask)
-        self.adjuster.setConfThresh(confidence_threshold)
+        self.adjuster_type = adjuster
+        self.refinement_mask = refinement_mask
+        self.confidence_threshold = confidence_threshold
+        self.cluster_size = cluster_size
+        self.max_iterations = max_iterations
+        self.epsilon = epsilon
+        self.time_budget = time_budget
+        self.nr_workers = nr_workers
+        self.adjuster = self.create_adjuster()
+        self.last_adjustment = None
+        self._report = None
+
+    def create_adjuster(self):
+        adjuster = CameraAdjuster.CAMERA_ADJUSTER_CHOICES[self.adjuster_type]()
+        adjuster.setRefinementMask(
+            CameraAdjuster.get_refinement_mask_matrix(self.refinement_mask)
+        )
+        adjuster.setConfThresh(self.confidence_threshold)
+        adjuster.setTermCriteria(
+            (
+                cv.TERM_CRITERIA_COUNT + cv.TERM_CRITERIA_EPS,
+                self.get_iterations_per_call(),
+                self.epsilon,
+            )
+        )
+        return adjuster
+
+    def get_iterations_per_call(self):
+        # with time budget, the adjustment is run step by step
+        if self.time_budget > 0:
+            return min(self.ITERATIONS_PER_STEP, self.max_iterations)
+        return self.max_iterations
 
     def set_refinement_mask(self, refinement_mask):
+        self.refinement_mask = refinement_mask
+        self.adjuster.setRefinementMask(
+            CameraAdjuster.get_refinement_mask_matrix(refinement_mask)
+        )
+
+    @staticmethod
+    def get_refinement_mask_matrix(refinement_mask):
         mask_matrix = np.zeros((3, 3), np.uint8)
         if refinement_mask[0] == "x":
             mask_matrix[0, 0] = 1
@@ -40,11 +180,247 @@ class CameraAdjuster:
             mask_matrix[1, 1] = 1
         if refinement_mask[4] == "x":
             mask_matrix[1, 2] = 1
-        self.adjuster.setRefinementMask(mask_matrix)
+        return mask_matrix
 
     def adjust(self, features, pairwise_matches, estimated_cameras):
-        b, cameras = self.adjuster.apply(features, pairwise_matches, estimated_cameras)
+        """Without time budget, opencv runs the adjustment at once. With time
+        budget, it is run in steps of ITERATIONS_PER_STEP iterations until the
+        budget is exceeded, the relative improvement of the error is not
+        greater than epsilon or max_iterations is reached. A step worsening
+        the error is discarded. opencv restarts its solver in every step, so
+        the cameras can differ from an adjustment without budget."""
+        start = time.perf_counter()
+        if 0 < self.cluster_size < len(estimated_cameras):
+            cameras, steps = self.adjust_hierarchically(
+                features, pairwise_matches, estimated_cameras
+            )
+        else:
+            cameras, steps = self.adjust_within_budget(
+                self.adjuster, features, pairwise_matches, estimated_cameras
+            )
+        elapsed = time.perf_counter() - start
+        self.last_adjustment = (
+            features,
+            pairwise_matches,
+            CameraLoader.rescale(estimated_cameras, 1),
+            CameraLoader.rescale(cameras, 1),
+            steps,
+            elapsed,
+        )
+        self._report = None
+        return cameras
+
+    @property
+    def report(self):
+        """AdjustmentReport of the last adjustment (errors in pixels, elapsed
+        in seconds), None before the first adjustment. steps is the number of
+        accepted steps with time budget and None without, since opencv
+        doesn't expose its number of iterations. The errors are computed when
+        the report is read first."""
+        if self._report is None and self.last_adjustment is not None:
+            features, pairwise_matches, estimated_cameras, cameras, steps, elapsed = (
+                self.last_adjustment
+            )
+            error = self.get_error_function(features, pairwise_matches)
+            self._report = AdjustmentReport(
+                steps, error(estimated_cameras), error(cameras), elapsed
+            )
+            self.last_adjustment = None
+        return self._report
+
+    def adjust_within_budget(
+        self, adjuster, features, pairwise_matches, estimated_cameras
+    ):
+        if self.time_budget <= 0:
+            cameras = self.adjust_with(
+                adjuster, features, pairwise_matches, estimated_cameras
+            )
+            return cameras, None
+
+        start = time.perf_counter()
+        error = self.get_error_function(features, pairwise_matches)
+        cameras, last_error = estimated_cameras, error(estimated_cameras)
+        steps, step_size = 0, self.get_iterations_per_call()
+        while (steps + 1) * step_size <= self.max_iterations:
+            new_cameras = self.adjust_with(
+                adjuster, features, pairwise_matches, cameras
+            )
+            current_error = error(new_cameras)
+            if current_error > last_error:
+                break
+            cameras = new_cameras
+            steps += 1
+            converged = last_error - current_error <= self.epsilon * last_error
+            if converged or time.perf_counter() - start > self.time_budget:
+                break
+            last_error = current_error
+        return cameras, steps
+
+    @staticmethod
+    def adjust_with(adjuster, features, pairwise_matches, estimated_cameras):
+        b, cameras = adjuster.apply(features, pairwise_matches, estimated_cameras)
         if not b:
             raise StitchingError("Camera parameters adjusting failed.")
 
         return cameras
+
+    def get_error_function(self, features, pairwise_matches):
+        return ReprojectionError(
+            features,
+            pairwise_matches,
+            self.confidence_threshold,
+            affine=self.adjuster_type in ("affine", "translation"),
+        )
+
+    def adjust_hierarchically(self, features, pairwise_matches, estimated_cameras):
+        """Adjusts overlapping clusters of the match graph in nr_workers
+        threads and aligns them using the images they share"""
+        clusters = self.get_clusters(pairwise_matches)
+        extended_clusters = self.extend_clusters(clusters, pairwise_matches)
+
+        def adjust_cluster(indices):
+            return self.adjust_within_budget(
+                self.create_adjuster(),
+                Subsetter.subset_list(features, indices),
+                Subsetter.subset_matches(pairwise_matches, indices),
+                Subsetter.subset_list(estimated_cameras, indices),
+            )
+
+        results = list(
+            parallel_map(adjust_cluster, extended_clusters, nr_workers=self.nr_workers)
+        )
+        cluster_cameras = [
+            dict(zip(indices, cameras))
+            for indices, (cameras, _) in zip(extended_clusters, results)
+        ]
+        if self.adjuster_type in ("ray", "reproj"):
+            self.unify_focals(cluster_cameras)
+        self.align_clusters(cluster_cameras)
+        self.refine_alignment(cluster_cameras)
+
+        cameras = [None] * len(estimated_cameras)
+        for cluster, cameras_of_cluster in zip(clusters, cluster_cameras):
+            for idx in cluster:
+                cameras[idx] = cameras_of_cluster[idx]
+        steps = [steps for _, steps in results]
+        return cameras, None if None in steps else sum(steps)
+
+    def get_clusters(self, pairwise_matches):
+        """Greedily grows clusters of cluster_size images along the strongest
+        matches exceeding the confidence threshold"""
+        confidences = self.get_confidences(pairwise_matches)
+        unassigned = np.ones(len(confidences), bool)
+        clusters = []
+        while np.any(unassigned):
+            idx = int(np.argmax(unassigned))
+            cluster, scores = [], np.zeros(len(confidences))
+            while idx is not None and len(cluster) < self.cluster_size:
+                cluster.append(idx)
+                unassigned[idx] = False
+                scores += confidences[idx]
+                candidates = np.where(unassigned & (scores > 0), scores, 0)
+                idx = int(np.argmax(candidates)) if np.any(candidates) else None
+            clusters.append(cluster)
+        return clusters
+
+    def extend_clusters(self, clusters, pairwise_matches):
+        """Adds the direct neighbours to the clusters so that neighbouring
+        clusters share images"""
+        connected = self.get_confidences(pairwise_matches) > 0
+        return [
+            sorted(set(cluster) | set(np.nonzero(connected[cluster].any(0))[0]))
+            for cluster in clusters
+        ]
+
+    def get_confidences(self, pairwise_matches):
+        confidences = FeatureMatcher.get_confidence_matrix(pairwise_matches)
+        confidences = np.maximum(confidences, confidences.T)
+        confidences[confidences <= self.confidence_threshold] = 0
+        np.fill_diagonal(confidences, 0)
+        return confidences
+
+    def align_clusters(self, cluster_cameras):
+        """Transforms the clusters one after another (starting with the one
+        sharing the most images with the already aligned ones) into the frame
+        of the first cluster. The transformation is the least squares fit
+        of the shared cameras."""
+        aligned = {}
+        remaining = list(range(len(cluster_cameras)))
+        while remaining:
+            shared = [
+                [idx for idx in cluster_cameras[c] if idx in aligned] for c in remaining
+            ]
+            position = int(np.argmax([len(indices) for indices in shared]))
+            cluster = cluster_cameras[remaining.pop(position)]
+            if len(aligned) > 0:
+                if len(shared[position]) == 0:
+                    raise StitchingError("Camera parameters adjusting failed.")
+                transformation = self.get_alignment(
+                    [aligned[idx].R for idx in shared[position]],
+                    [cluster[idx].R for idx in shared[position]],
+                )
+                for camera in cluster.values():
+                    camera.R = (transformation @ camera.R).astype(np.float32)
+            for idx, camera in cluster.items():
+                aligned.setdefault(idx, camera)
+
+    def unify_focals(self, cluster_cameras):
+        """Small clusters often converge to different focal lengths, which a
+        rotation can't align. Each cluster is scaled to the median focal of
+        all clusters and its rotations relative to its first camera are
+        scaled inversely, which keeps the distances of its images (in the
+        small angle approximation)"""
+        focals = [
+            np.median([c.focal for c in cluster.values()])
+            for cluster in cluster_cameras
+        ]
+        focal = np.median(focals)
+        for cluster, cluster_focal in zip(cluster_cameras, focals):
+            scale = focal / cluster_focal
+            reference = next(iter(cluster.values())).R.astype(np.float64)
+            for camera in cluster.values():
+                rotation = np.linalg.inv(reference) @ camera.R
+                rvec, _ = cv.Rodrigues(rotation)
+                rotation, _ = cv.Rodrigues(rvec / scale)
+                camera.R = (reference @ rotation).astype(np.float32)
+                camera.focal *= scale
+
+    def refine_alignment(self, cluster_cameras):
+        """Refines the transformations of all clusters jointly: each cluster
+        but the first is fitted in turn to the cameras the other clusters
+        have of its shared images, until the transformations converge. This
+        minimizes the differences of all shared cameras instead of
+        accumulating the errors along the chained alignment"""
+        for _ in range(self.MAX_ALIGNMENT_ITERATIONS):
+            change = 0
+            for cluster in cluster_cameras[1:]:
+                shared = [
+                    (other[idx].R, camera.R)
+                    for idx, camera in cluster.items()
+                    for other in cluster_cameras
+                    if other is not cluster and idx in other
+                ]
+                if len(shared) == 0:
+                    continue
+                transformation = self.get_alignment(*zip(*shared))
+                for camera in cluster.values():
+                    camera.R = (transformation @ camera.R).astype(np.float32)
+                change = max(change, np.abs(transformation - np.eye(3)).max())
+            if change < self.ALIGNMENT_TOLERANCE:
+                break
+
+    def get_alignment(self, target_rotations, rotations):
+        """G minimizing the sum of |G R - R_target|^2, a rotation for the
+        rotation based adjusters"""
+        targets = [R.astype(np.float64) for R in target_rotations]
+        sources = [R.astype(np.float64) for R in rotations]
+        if self.adjuster_type in ("ray", "reproj"):
+            u, _, vt = np.linalg.svd(sum(T @ R.T for T, R in zip(targets, sources)))
+            d = np.sign(np.linalg.det(u @ vt))
+            return u @ np.diag([1, 1, d]) @ vt
+        transformation, *_ = np.linalg.lstsq(
+            np.vstack([R.T for R in sources]),
+            np.vstack([T.T for T in targets]),
+            rcond=None,
+        )
+        return transformation.T
@@ -3,15 +3,60 @@ from collections import OrderedDict
 import cv2 as cv
 import numpy as np
 
+from .camera_loader import CameraLoader
 from .stitching_error import StitchingError
 
 
+class TranslationEstimator:
+    """Chains the translations of the matches along the maximum spanning tree
+    of the match confidences (like the estimators of opencv)"""
+
+    def apply(self, features, pairwise_matches, cameras):
+        nr_imgs = len(features)
+        edges = []
+        for idx, match in enumerate(pairwise_matches):
+            i, j = divmod(idx, nr_imgs)
+            if i < j and match.confidence > 0:
+                edges.append((match.confidence, i, j, match.H))
+        edges.sort(key=lambda edge: edge[0], reverse=True)
+        components = list(range(nr_imgs))
+        tree = {idx: [] for idx in range(nr_imgs)}
+        for _, i, j, H in edges:
+            if components[i] != components[j]:
+                old, new = components[j], components[i]
+                components = [new if c == old else c for c in components]
+                tree[i].append((j, H[:2, 2]))
+                tree[j].append((i, -H[:2, 2]))
+        if len(set(components)) > 1:
+            return False, None
+
+        translations = {0: np.zeros(2)}
+        queue = [0]
+        while queue:
+            i = queue.pop()
+            for j, translation in tree[i]:
+                if j not in translations:
+                    translations[j] = translations[i] + translation
+                    queue.append(j)
+        return True, [
+            TranslationEstimator.create_camera(translations[idx])
+            for idx in range(nr_imgs)
+        ]
+
+    @staticmethod
+    def create_camera(translation):
+        H = np.eye(3)
+        H[:2, 2] = translation
+        return CameraLoader.create_camera(np.eye(3), H)
+
+
 class CameraEstimator:
     """https://docs.opencv.org/4.x/df/d15/classcv_1_1detail_1_1Estimator.html"""
 
     CAMERA_ESTIMATOR_CHOICES = OrderedDict()
     CAMERA_ESTIMATOR_CHOICES["homography"] = cv.detail_HomographyBasedEstimator
     CAMERA_ESTIMATOR_CHOICES["affine"] = cv.detail_AffineBasedEstimator
+    CAMERA_ESTIMATOR_CHOICES["translation"] = TranslationEstimator
 
     DEFAULT_CAMERA_ESTIMATOR = list(CAMERA_ESTIMATOR_CHOICES.keys())[0]
 
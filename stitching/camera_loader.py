@@ -0,0 +1,98 @@
+import json
+
+import cv2 as cv
+import numpy as np
+
+from .stitching_error import StitchingError
+
+
+class CameraLoader:
+    """Creates camera parameters from externally known poses (e.g. IMU or
+    gimbal telemetry or CAD data of fixed installations), so that the feature
+    based registration can be skipped.
+
+    Intrinsics, rotations and homographies refer to the original (full
+    resolution) input images. Homographies are used with the affine warper."""
+
+    @staticmethod
+    def from_intrinsics_and_rotations(intrinsics, rotations):
+        if len(intrinsics) != len(rotations):
+            raise StitchingError("intrinsics and rotations must be of same length")
+        return [CameraLoader.create_camera(K, R) for K, R in zip(intrinsics, rotations)]
+
+    @staticmethod
+    def from_homographies(homographies):
+        return [CameraLoader.create_camera(np.eye(3), H) for H in homographies]
+
+    @staticmethod
+    def from_dicts(camera_dicts):
+        cameras = []
+        for idx, camera_dict in enumerate(camera_dicts):
+            if "H" in camera_dict:
+                cameras.append(CameraLoader.create_camera(np.eye(3), camera_dict["H"]))
+            elif "K" in camera_dict and "R" in camera_dict:
+                cameras.append(
+                    CameraLoader.create_camera(camera_dict["K"], camera_dict["R"])
+                )
+            else:
+                raise StitchingError(
+                    f"Camera {idx + 1} needs either 'K' and 'R' or 'H' entries"
+                )
+        return cameras
+
+    @staticmethod
+    def read_json(filename):
+        """[{"K": [[fx, 0, ppx], [0, fy, ppy], [0, 0, 1]], "R": [[...], ...]}, ...]
+        or [{"H": [[...], ...]}, ...] with one entry per image"""
+        with open(filename, "r") as filehandler:
+            return CameraLoader.from_dicts(json.load(filehandler))
+
+    @staticmethod
+    def create_camera(K, R):
+        K = np.asarray(K, dtype=np.float64)
+        R = np.asarray(R, dtype=np.float32)
+        if R.shape == (2, 3):
+            R = np.vstack([R, np.array([0, 0, 1], np.float32)])
+        if K.shape != (3, 3) or R.shape != (3, 3):
+            raise StitchingError("K and R must be 3x3 matrices, H a 3x3 or 2x3 matrix")
+        camera = cv.detail.CameraParams()
+        camera.focal = K[0, 0]
+        camera.aspect = K[1, 1] / K[0, 0]
+        camera.ppx = K[0, 2]
+        camera.ppy = K[1, 2]
+        camera.R = R
+        camera.t = np.zeros((3, 1), np.float64)
+        return camera
+
+    @staticmethod
+    def check_number_of_cameras(cameras, number_imgs):
+        if len(cameras) != number_imgs:
+            raise StitchingError(
+                f"{len(cameras)} cameras given for {number_imgs} images. "
+                "One camera per image is needed."
+            )
+
+    @staticmethod
+    def rescale(cameras, scale, affine=False):
+        """Returns copies of the cameras for images scaled by scale.
+        For the affine warper, R is a homography in pixel coordinates and
+        is rescaled instead of the intrinsics."""
+        S = np.diag([scale, scale, 1.0])
+        scaled_cameras = []
+        for camera in cameras:
+            scaled_camera = cv.detail.CameraParams()
+            scaled_camera.aspect = camera.aspect
+            scaled_camera.t = np.copy(camera.t)
+            if affine:
+                scaled_camera.focal = camera.focal
+                scaled_camera.ppx = camera.ppx
+                scaled_camera.ppy = camera.ppy
+                R = S @ camera.R.astype(np.float64) @ np.linalg.inv(S)
+            else:
+                scaled_camera.focal = camera.focal * scale
+                scaled_camera.ppx = camera.ppx * scale
+                scaled_camera.ppy = camera.ppy * scale
+                R = camera.R
+            scaled_camera.R = R.astype(np.float32)
+            scaled_cameras.append(scaled_camera)
+        return scaled_cameras
@@ -10,10 +10,11 @@ from datetime import datetime
 import cv2 as cv
 import numpy as np
 
-from stitching import AffineStitcher, Stitcher, __version__
+from stitching import AffineStitcher, Stitcher, TranslationStitcher, __version__
 from stitching.blender import Blender
 from stitching.camera_adjuster import CameraAdjuster
 from stitching.camera_estimator import CameraEstimator
+from stitching.camera_loader import CameraLoader
 from stitching.camera_wave_corrector import WaveCorrector
 from stitching.cropper import Cropper
 from stitching.exposure_error_compensator import ExposureErrorCompensator
@@ -42,13 +43,21 @@ def create_parser():
         default=datetime.now().strftime("%Y%m%d_%H%M%S") + "_verbose_results",
         help="The directory where verbose results should be saved.",
     )
-    parser.add_argument(
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
         "--affine",
         action="store_true",
         help="Overwrites multiple parameters to optimize the stitching for "
         "scans and images captured by specialized devices. The follwing parameters "
         "are set: " + str(AffineStitcher.AFFINE_DEFAULTS),
     )
+    mode.add_argument(
+        "--translation",
+        action="store_true",
+        help="Like --affine, but for scans whose images are only shifted against "
+        "each other (e.g. flatbed or microscope stage scans). The follwing "
+        "parameters are set: " + str(TranslationStitcher.AFFINE_DEFAULTS),
+    )
     parser.add_argument(
         "--medium_megapix",
         action="store",
@@ -156,6 +165,60 @@ def create_parser():
         "" % CameraAdjuster.DEFAULT_REFINEMENT_MASK,
         type=str,
     )
+    parser.add_argument(
+        "--adjuster_cluster_size",
+        action="store",
+        default=CameraAdjuster.DEFAULT_CLUSTER_SIZE,
+        help="Adjusts large image sets hierarchically: the match graph is split "
+        "into overlapping clusters of this number of images which are adjusted "
+        "in parallel (see --nr_workers) and aligned jointly afterwards. "
+        "The default is %s (adjust all images at once)."
+        % CameraAdjuster.DEFAULT_CLUSTER_SIZE,
+        type=int,
+    )
+    parser.add_argument(
+        "--adjuster_max_iterations",
+        action="store",
+        default=CameraAdjuster.DEFAULT_MAX_ITERATIONS,
+        help="Maximum number of bundle adjustment iterations. "
+        "The default is %s." % CameraAdjuster.DEFAULT_MAX_ITERATIONS,
+        type=int,
+    )
+    parser.add_argument(
+        "--adjuster_epsilon",
+        action="store",
+        default=CameraAdjuster.DEFAULT_EPSILON,
+        help="Bundle adjustment stops if the change is not greater than epsilon. "
+        "The default is %s." % CameraAdjuster.DEFAULT_EPSILON,
+        type=float,
+    )
+    parser.add_argument(
+        "--adjuster_time_budget",
+        action="store",
+        default=CameraAdjuster.DEFAULT_TIME_BUDGET,
+        help="Time budget for bundle adjustment in seconds. The adjustment is "
+        "then run in steps of few iterations until the budget is exceeded. "
+        "The solver restarts in every step, so the result can differ from an "
+        "adjustment without budget. "
+        "The default is %s (no budget)." % CameraAdjuster.DEFAULT_TIME_BUDGET,
+        type=float,
+    )
+    parser.add_argument(
+        "--cameras",
+        action="store",
+        default=None,
+        help="JSON file with the known camera parameters of each image in "
+        "original resolution: a list of objects with the intrinsics 'K' and "
+        "the rotation 'R' (or the homography 'H' when using the affine "
+        "warper). Skips feature detection, matching and camera estimation.",
+        type=str,
+    )
+    parser.add_argument(
+        "--refine_given_cameras",
+        action="store_true",
+        help="Refine the cameras given with --cameras by bundle adjustment. "
+        "Feature detection and matching are performed for this.",
+    )
     parser.add_argument(
         "--wave_correct_kind",
         action="store",
@@ -173,14 +236,37 @@ def create_parser():
         choices=Warper.WARP_TYPE_CHOICES,
         type=str,
     )
+    parser.add_argument(
+        "--nr_workers",
+        action="store",
+        default=Warper.DEFAULT_NR_WORKERS,
+        help="Number of images which are warped and exposure compensated in "
+        "parallel (and, with --overlap_bands, of image pairs whose seams are "
+        "found in parallel, with --blend_tile_size of tiles which are blended "
+        "in parallel, with --adjuster_cluster_size of clusters which are "
+        "adjusted in parallel). "
+        "Higher numbers speed up the stitching on multi core machines but need "
+        "more memory. "
+        "The default is %s." % Warper.DEFAULT_NR_WORKERS,
+        type=int,
+    )
     parser.add_argument(
         "--low_megapix",
         action="store",
         default=Images.Resolution.LOW.value,
-        help="Resolution for seam estimation and exposure estimation step. "
+        help="Resolution for crop estimation and exposure estimation step (and "
+        "the seam estimation if no seam_megapix is given). "
         "The default is %s Mpx." % Images.Resolution.LOW.value,
         type=float,
     )
+    parser.add_argument(
+        "--seam_megapix",
+        action="store",
+        default=Images.Resolution.SEAM.value,
+        help="Resolution for seam estimation step. Higher resolutions give "
+        "better seams but take longer. The default is the low_megapix.",
+        type=float,
+    )
     parser.add_argument(
         "--crop",
         action="store_true",
@@ -221,6 +307,34 @@ def create_parser():
         "The default is '%s'." % ExposureErrorCompensator.DEFAULT_BLOCK_SIZE,
         type=np.int32,
     )
+    parser.add_argument(
+        "--compensator_update_interval",
+        action="store",
+        default=ExposureErrorCompensator.DEFAULT_UPDATE_INTERVAL,
+        help="Estimate the exposure gains only every n-th stitch of the same "
+        "stitcher (e.g. for the frames of a camera rig) or if the brightness "
+        "drifted. The default is '%s'."
+        % ExposureErrorCompensator.DEFAULT_UPDATE_INTERVAL,
+        type=int,
+    )
+    parser.add_argument(
+        "--gain_smoothing",
+        action="store",
+        default=ExposureErrorCompensator.DEFAULT_GAIN_SMOOTHING,
+        help="Weight of the previous gains when new gains are estimated "
+        "(exponential smoothing, 0 disables it). "
+        "The default is '%s'." % ExposureErrorCompensator.DEFAULT_GAIN_SMOOTHING,
+        type=float,
+    )
+    parser.add_argument(
+        "--brightness_drift",
+        action="store",
+        default=ExposureErrorCompensator.DEFAULT_BRIGHTNESS_DRIFT,
+        help="Relative change of the mean brightness of an image which triggers "
+        "a new estimation of the gains before the update interval is over. "
+        "The default is '%s'." % ExposureErrorCompensator.DEFAULT_BRIGHTNESS_DRIFT,
+        type=float,
+    )
     parser.add_argument(
         "--finder",
         action="store",
@@ -230,6 +344,13 @@ def create_parser():
         choices=SeamFinder.SEAM_FINDER_CHOICES.keys(),
         type=str,
     )
+    parser.add_argument(
+        "--overlap_bands",
+        action="store_true",
+        help="Find the seams only in the overlaps of the images (and a small "
+        "margin around them) instead of in the whole images. Needs less memory, "
+        "especially with a higher low_megapix.",
+    )
     parser.add_argument(
         "--final_megapix",
         action="store",
@@ -254,6 +375,30 @@ def create_parser():
         "The default is '%s'." % Blender.DEFAULT_BLEND_STRENGTH,
         type=np.int32,
     )
+    parser.add_argument(
+        "--blend_tile_size",
+        action="store",
+        default=None,
+        help="Blend the panorama in tiles of this size (in pixels) to limit the "
+        "memory needed for very large panoramas. The images are buffered in a "
+        "temporary directory and the panorama is written to a memory mapped "
+        "file. By default the panorama is blended at once.",
+        type=int,
+    )
+    parser.add_argument(
+        "--blend_tmp_dir",
+        action="store",
+        default=None,
+        help="Directory for the temporary files of the tiled blending. "
+        "The default is the system's temporary directory.",
+        type=str,
+    )
+    parser.add_argument(
+        "--blend_in_memory",
+        action="store_true",
+        help="Keep the images and the panorama of the tiled blending in memory "
+        "(e.g. to blend the tiles in parallel with --nr_workers).",
+    )
     parser.add_argument(
         "--timelapse",
         action="store",
@@ -305,6 +450,8 @@ def main():
     # Extract In- and Output
     images = Images.resolve_wildcards(args_dict.pop("images"))
     feature_masks = Images.resolve_wildcards(args_dict.pop("feature_masks"))
+    cameras_file = args_dict.pop("cameras")
+    cameras = None if cameras_file is None else CameraLoader.read_json(cameras_file)
 
     verbose = args_dict.pop("verbose")
     verbose_dir = args_dict.pop("verbose_dir")
@@ -314,8 +461,12 @@ def main():
 
     # Create Stitcher
     affine_mode = args_dict.pop("affine")
+    translation_mode = args_dict.pop("translation")
 
-    if affine_mode:
+    if translation_mode:
+        args_dict.update(TranslationStitcher.AFFINE_DEFAULTS)
+        stitcher = TranslationStitcher(**args_dict)
+    elif affine_mode:
         args_dict.update(AffineStitcher.AFFINE_DEFAULTS)
         stitcher = AffineStitcher(**args_dict)
     else:
@@ -324,10 +475,10 @@ def main():
     if verbose:
         print("stitching " + " ".join(images) + " into " + verbose_dir)
         os.makedirs(verbose_dir)
-        panorama = stitcher.stitch_verbose(images, feature_masks, verbose_dir)
+        panorama = stitcher.stitch_verbose(images, feature_masks, verbose_dir, cameras)
     else:
         print("stitching " + " ".join(images) + " into " + output)
-        panorama = stitcher.stitch(images, feature_masks)
+        panorama = stitcher.stitch(images, feature_masks, cameras)
         cv.imwrite(output, panorama, output_params)
 
     if preview:
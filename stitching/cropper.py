@@ -1,9 +1,10 @@
+import heapq
+from bisect import bisect_left
 from collections import namedtuple
 
 import cv2 as cv
 import numpy as np
 
-from .blender import Blender
 from .stitching_error import StitchingError
 
 
@@ -52,7 +53,7 @@ class Cropper:
 
     def prepare(self, imgs, masks, corners, sizes):
         if self.do_crop:
-            mask = self.estimate_panorama_mask(imgs, masks, corners, sizes)
+            mask = self.create_panorama_mask(masks, corners, sizes)
             lir = self.estimate_largest_interior_rectangle(mask)
             corners = self.get_zero_center_corners(corners)
             rectangles = self.get_rectangles(corners, sizes)
@@ -73,6 +74,12 @@ class Cropper:
             return cropped_img
         return img
 
+    def get_crop_rectangles(self, aspect=1):
+        """The rectangles within the warped images which are kept, None if
+        not cropping"""
+        if self.do_crop:
+            return [r.times(aspect) for r in self.intersection_rectangles]
+
     def crop_rois(self, corners, sizes, aspect=1):
         if self.do_crop:
             scaled_overlaps = [r.times(aspect) for r in self.overlapping_rectangles]
@@ -84,25 +91,75 @@ class Cropper:
 
     @staticmethod
     def estimate_panorama_mask(imgs, masks, corners, sizes):
-        _, mask = Blender.create_panorama(imgs, masks, corners, sizes)
-        return mask
+        """The images are not needed, see create_panorama_mask"""
+        return Cropper.create_panorama_mask(masks, corners, sizes)
 
-    def estimate_largest_interior_rectangle(self, mask):
-        # largestinteriorrectangle is only imported if cropping
-        # is explicitly desired (needs some time to compile at the first run!)
-        import largestinteriorrectangle
+    @staticmethod
+    def create_panorama_mask(masks, corners, sizes):
+        """Union of the masks placed at their corners, equal to the mask
+        of Blender.create_panorama"""
+        x, y, width, height = cv.detail.resultRoi(corners=corners, sizes=sizes)
+        panorama_mask = np.zeros((height, width), np.uint8)
+        for mask, corner in zip(masks, corners):
+            mask = cv.UMat.get(mask) if isinstance(mask, cv.UMat) else mask
+            roi = Rectangle(corner[0] - x, corner[1] - y, mask.shape[1], mask.shape[0])
+            panorama_roi = Cropper.crop_rectangle(panorama_mask, roi)
+            np.bitwise_or(panorama_roi, mask, out=panorama_roi)
+        return panorama_mask
 
-        contours, hierarchy = cv.findContours(mask, cv.RETR_TREE, cv.CHAIN_APPROX_NONE)
+    def estimate_largest_interior_rectangle(self, mask):
+        _, hierarchy = cv.findContours(mask, cv.RETR_TREE, cv.CHAIN_APPROX_NONE)
         if not hierarchy.shape == (1, 1, 4) or not np.all(hierarchy == -1):
             raise StitchingError(
                 "Invalid Contour. Run with --no-crop (using the stitch interface), crop=false (using the stitcher class) or Cropper(False) (using the cropper class)"  # noqa: E501
             )
-        contour = contours[0][:, 0, :]
 
-        lir = largestinteriorrectangle.lir(mask > 0, contour)
-        lir = Rectangle(*lir)
+        lir = Cropper.largest_interior_rectangle(mask > 0)
         return lir
 
+    @staticmethod
+    def largest_interior_rectangle(grid):
+        """Largest rectangle of True cells (the top left and then widest one
+        if there are several) like the largestinteriorrectangle package, but
+        vectorised with numpy so there is no JIT compilation. The left and
+        right border of the rectangle above each cell are searched in a table
+        of the minimum heights of 2**k neighbouring cells"""
+        rows = np.arange(grid.shape[0])[:, None]
+        last_false_rows = np.maximum.accumulate(np.where(grid, -1, rows), axis=0)
+        heights = ((rows - last_false_rows) * grid).astype(np.int32)
+
+        # cells next to a cell of same height span the same rectangle
+        candidates = heights > 0
+        candidates[:, 1:] &= heights[:, 1:] != heights[:, :-1]
+        if not np.any(candidates):
+            raise StitchingError("No interior rectangle found")
+        ys, xs = np.nonzero(candidates)
+        hs = heights[ys, xs]
+
+        minimums = [heights]
+        while 2 ** len(minimums) <= grid.shape[1]:
+            half = 2 ** (len(minimums) - 1)
+            minimums.append(np.minimum(minimums[-1][:, :-half], minimums[-1][:, half:]))
+
+        lefts, rights = xs.copy(), xs + 1
+        for k in reversed(range(len(minimums))):
+            step = 2**k
+            extend = lefts >= step
+            extend[extend] = minimums[k][ys[extend], lefts[extend] - step] >= hs[extend]
+            lefts[extend] -= step
+            extend = rights < minimums[k].shape[1]
+            extend[extend] = minimums[k][ys[extend], rights[extend]] >= hs[extend]
+            rights[extend] += step
+
+        widths = rights - lefts
+        areas = hs.astype(np.int64) * widths
+        largest = np.nonzero(areas == areas.max())[0]
+        tops = ys[largest] - hs[largest] + 1
+        idx = largest[np.lexsort((-widths[largest], lefts[largest], tops))[0]]
+        return Rectangle(
+            int(lefts[idx]), int(ys[idx] - hs[idx] + 1), int(widths[idx]), int(hs[idx])
+        )
+
     @staticmethod
     def get_zero_center_corners(corners):
         min_corner_x = min([corner[0] for corner in corners])
@@ -149,3 +206,100 @@ class Cropper:
     @staticmethod
     def crop_rectangle(img, rectangle):
         return img[rectangle.y : rectangle.y2, rectangle.x : rectangle.x2]
+
+
+class RoiIndex:
+    """Index of rectangles (e.g. the warped rois of the images) sorted by x.
+    The overlapping pairs are found with a sweep line over x, which only
+    compares rectangles whose x ranges overlap"""
+
+    def __init__(self, rectangles):
+        self.rectangles = list(rectangles)
+        self.order = sorted(
+            range(len(self.rectangles)), key=lambda i: self.rectangles[i].x
+        )
+        self.xs = [self.rectangles[i].x for i in self.order]
+        # max_x2[level][i] is the largest x2 of the rectangles in the block
+        # order[i * 2**level : (i + 1) * 2**level]
+        self.max_x2 = [[self.rectangles[i].x2 for i in self.order]]
+        while len(self.max_x2[-1]) > 1:
+            x2s = self.max_x2[-1]
+            self.max_x2.append([max(x2s[i : i + 2]) for i in range(0, len(x2s), 2)])
+
+    @classmethod
+    def of(cls, corners, sizes):
+        return cls(Cropper.get_rectangles(corners, sizes))
+
+    def overlapping_pairs(self):
+        """The pairs (i, j) with i < j of overlapping rectangles, in the order
+        of itertools.combinations"""
+        pairs = []
+        active = []  # heap of the (x2, idx) of the rectangles crossing the line
+        for idx in self.order:
+            rectangle = self.rectangles[idx]
+            if rectangle.width <= 0 or rectangle.height <= 0:
+                continue
+            while active and active[0][0] <= rectangle.x:
+                heapq.heappop(active)
+            # the x ranges of the active rectangles overlap with the rectangle
+            for _, other in active:
+                other_y, other_y2 = self.rectangles[other].y, self.rectangles[other].y2
+                if other_y < rectangle.y2 and rectangle.y < other_y2:
+                    pairs.append((min(idx, other), max(idx, other)))
+            heapq.heappush(active, (rectangle.x2, idx))
+        return sorted(pairs)
+
+    def intersecting(self, rectangle):
+        """The sorted indices of the rectangles intersecting the rectangle
+        (e.g. the images of a tile). Of the rectangles starting before its
+        end, only the blocks reaching beyond its start are visited"""
+        end = bisect_left(self.xs, rectangle.x2)
+        hits = []
+        blocks = [(len(self.max_x2) - 1, 0)] if end > 0 else []
+        while blocks:
+            level, i = blocks.pop()
+            if i >= len(self.max_x2[level]) or i << level >= end:
+                continue
+            if self.max_x2[level][i] <= rectangle.x:
+                continue
+            if level > 0:
+                blocks += [(level - 1, 2 * i), (level - 1, 2 * i + 1)]
+                continue
+            idx = self.order[i]
+            if get_intersection(self.rectangles[idx], rectangle) is not None:
+                hits.append(idx)
+        return sorted(hits)
+
+
+def get_intersection(rectangle1, rectangle2):
+    x1 = max(rectangle1.x, rectangle2.x)
+    y1 = max(rectangle1.y, rectangle2.y)
+    x2 = min(rectangle1.x2, rectangle2.x2)
+    y2 = min(rectangle1.y2, rectangle2.y2)
+    if x2 <= x1 or y2 <= y1:
+        return None
+    return Rectangle(x1, y1, x2 - x1, y2 - y1)
+
+
+def get_union(rectangle1, rectangle2):
+    x1 = min(rectangle1.x, rectangle2.x)
+    y1 = min(rectangle1.y, rectangle2.y)
+    x2 = max(rectangle1.x2, rectangle2.x2)
+    y2 = max(rectangle1.y2, rectangle2.y2)
+    return Rectangle(x1, y1, x2 - x1, y2 - y1)
+
+
+def grow(rectangle, margin):
+    return Rectangle(
+        rectangle.x - margin,
+        rectangle.y - margin,
+        rectangle.width + 2 * margin,
+        rectangle.height + 2 * margin,
+    )
+
+
+def crop(img, rectangle, corner):
+    """view of the rectangle (in panorama coordinates) of an image placed at
+    corner"""
+    x, y = rectangle.x - corner[0], rectangle.y - corner[1]
+    return img[y : y + rectangle.height, x : x + rectangle.width]
@@ -1,6 +1,9 @@
 from collections import OrderedDict
 
 import cv2 as cv
+import numpy as np
+
+from .parallel import parallel_map
 
 
 class ExposureErrorCompensator:
@@ -15,31 +18,156 @@ class ExposureErrorCompensator:
     )
     COMPENSATOR_CHOICES["no"] = cv.detail.ExposureCompensator_NO
 
+    BLOCK_COMPENSATORS = ("gain_blocks", "channel_blocks")
+
     DEFAULT_COMPENSATOR = list(COMPENSATOR_CHOICES.keys())[0]
     DEFAULT_NR_FEEDS = 1
     DEFAULT_BLOCK_SIZE = 32
+    DEFAULT_UPDATE_INTERVAL = 1
+    DEFAULT_GAIN_SMOOTHING = 0
+    DEFAULT_BRIGHTNESS_DRIFT = 0.05
+    DEFAULT_NR_WORKERS = 1
 
     def __init__(
         self,
         compensator=DEFAULT_COMPENSATOR,
         nr_feeds=DEFAULT_NR_FEEDS,
         block_size=DEFAULT_BLOCK_SIZE,
+        update_interval=DEFAULT_UPDATE_INTERVAL,
+        gain_smoothing=DEFAULT_GAIN_SMOOTHING,
+        brightness_drift=DEFAULT_BRIGHTNESS_DRIFT,
+        nr_workers=DEFAULT_NR_WORKERS,
     ):
-        if compensator == "channel":
-            self.compensator = cv.detail_ChannelsCompensator(nr_feeds)
-        elif compensator == "channel_blocks":
-            self.compensator = cv.detail_BlocksChannelsCompensator(
-                block_size, block_size, nr_feeds
-            )
-        else:
-            self.compensator = cv.detail.ExposureCompensator_createDefault(
-                ExposureErrorCompensator.COMPENSATOR_CHOICES[compensator]
+        self.nr_workers = nr_workers
+        self.update_interval = update_interval
+        self.gain_smoothing = gain_smoothing
+        self.brightness_drift = brightness_drift
+        self.feeds_since_update = None
+        self.brightness = None
+        self.compensator_type = compensator
+        self.nr_feeds = nr_feeds
+        self.block_size = block_size
+        self.compensator = self.create_compensator()
+
+    def create_compensator(self):
+        if self.compensator_type == "channel":
+            return cv.detail_ChannelsCompensator(self.nr_feeds)
+        elif self.compensator_type == "channel_blocks":
+            return cv.detail_BlocksChannelsCompensator(
+                self.block_size, self.block_size, self.nr_feeds
             )
+        return cv.detail.ExposureCompensator_createDefault(
+            ExposureErrorCompensator.COMPENSATOR_CHOICES[self.compensator_type]
+        )
+
+    def feed(self, corners, imgs, masks):
+        """https://docs.opencv.org/4.x/d2/d37/classcv_1_1detail_1_1ExposureCompensator.html#ae6b0cc69a7bc53818ddea53eddb6bdba
+
+        For consecutive frames (e.g. of a camera rig) the gains are only
+        estimated every update_interval feeds or if the mean brightness of an
+        image changed by more than brightness_drift (relative) since the last
+        estimation. The new gains are smoothed exponentially with the previous
+        ones (gain_smoothing is the weight of the previous gains)"""  # noqa
+        brightness = None
+        if self.update_interval > 1:
+            brightness = [
+                np.mean(cv.mean(img, mask)[:3]) for img, mask in zip(imgs, masks)
+            ]
+        if self.needs_update(brightness):
+            if self.gain_smoothing > 0:
+                previous_gains = self.get_gains()
+                self.compensator.feed(corners, imgs, masks)
+                self.smooth_gains(previous_gains)
+            else:
+                self.compensator.feed(corners, imgs, masks)
+            self.feeds_since_update = 0
+            self.brightness = brightness
+        elif self.brightness is None:
+            self.brightness = brightness
+        self.feeds_since_update += 1
+
+    def needs_update(self, brightness):
+        if self.feeds_since_update is None:
+            return True
+        if self.feeds_since_update >= self.update_interval:
+            return True
+        if self.brightness is None:
+            return False
+        if len(brightness) != len(self.brightness):
+            return True
+        return any(
+            abs(new - old) > self.brightness_drift * max(old, 1)
+            for new, old in zip(brightness, self.brightness)
+        )
 
-    def feed(self, *args):
-        """https://docs.opencv.org/4.x/d2/d37/classcv_1_1detail_1_1ExposureCompensator.html#ae6b0cc69a7bc53818ddea53eddb6bdba"""  # noqa
-        self.compensator.feed(*args)
+    def smooth_gains(self, previous_gains):
+        gains = self.get_gains()
+        if len(previous_gains) != len(gains):
+            return
+        if any(old.shape != new.shape for old, new in zip(previous_gains, gains)):
+            return
+        self.set_gains(
+            [
+                self.gain_smoothing * old + (1 - self.gain_smoothing) * new
+                for old, new in zip(previous_gains, gains)
+            ]
+        )
+
+    def get_gains(self):
+        """The gains (or gain maps of the block compensators) per image"""
+        return [np.array(gains) for gains in self.compensator.getMatGains()]
+
+    def set_gains(self, gains):
+        """Sets previously estimated gains, which are used until the next
+        update (see feed)"""
+        # the block and channel compensators append to their existing gains
+        self.compensator = self.create_compensator()
+        self.compensator.setMatGains([np.asarray(g) for g in gains])
+        self.feeds_since_update = 0
+        self.brightness = None
+
+    def write_gains(self, filename):
+        np.savez(filename, *self.get_gains())
+
+    def read_gains(self, filename):
+        with np.load(filename) as gains:
+            self.set_gains([gains[f"arr_{i}"] for i in range(len(gains.files))])
 
     def apply(self, *args):
         """https://docs.opencv.org/4.x/d2/d37/classcv_1_1detail_1_1ExposureCompensator.html#a473eaf1e585804c08d77c91e004f93aa"""  # noqa
         return self.compensator.apply(*args)
+
+    def apply_to_images(self, corners, imgs):
+        """Compensates the images in place in nr_workers threads. Equal to
+        apply, but the gain compensator uses a lookup table per image and the
+        gain maps of the block compensators are only fetched once"""
+        if self.compensator_type == "no":
+            return iter(imgs)
+        if self.compensator_type == "gain":
+            gains = [self.get_lut(idx) for idx in range(len(corners))]
+        elif self.compensator_type in self.BLOCK_COMPENSATORS:
+            gains = self.get_gains()
+        else:
+            gains = [None] * len(corners)
+        return parallel_map(
+            self.apply_in_place,
+            range(len(corners)),
+            corners,
+            imgs,
+            gains,
+            nr_workers=self.nr_workers,
+        )
+
+    def apply_in_place(self, idx, corner, img, gains):
+        if gains is None or img.dtype != np.uint8 or img.ndim != 3:
+            return self.apply(idx, corner, img, None)
+        if self.compensator_type == "gain":
+            return cv.LUT(img, gains, dst=img)
+        gain_map = cv.resize(gains, img.shape[1::-1], interpolation=cv.INTER_LINEAR)
+        if gain_map.ndim == 2:
+            gain_map = cv.merge([gain_map] * 3)
+        return cv.multiply(img, gain_map, dst=img, dtype=cv.CV_8U)
+
+    def get_lut(self, idx):
+        """The gain of the image applied to all 8 bit values"""
+        return self.apply(idx, (0, 0), np.arange(256, dtype=np.uint8)[None], None)
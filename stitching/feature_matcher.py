@@ -4,17 +4,130 @@ import cv2 as cv
 import numpy as np
 
 
+class TranslationMatcher:
+    """Matches images which are only shifted against each other (e.g. scans).
+    The shift is the best consensus of the shifts of the matched keypoints,
+    which is much faster than matching and fitting affine transformations or
+    homographies. The matches are filtered like in opencv's matchers."""
+
+    INLIER_THRESHOLD = 3
+    MIN_MATCHES = 6
+    MAX_CANDIDATES = 200
+
+    def __init__(self, range_width=-1, try_use_gpu=False, match_conf=0.3):
+        self.range_width = range_width
+        self.match_conf = match_conf
+
+    def apply2(self, features, mask=None):
+        nr_imgs = len(features)
+        if mask is None:
+            mask = np.triu(np.ones((nr_imgs, nr_imgs), np.uint8), k=1)
+            if self.range_width != -1:
+                mask[np.triu_indices(nr_imgs, k=self.range_width)] = 0
+        descriptors = [TranslationMatcher.get_descriptors(f) for f in features]
+        points = [
+            cv.KeyPoint_convert(f.getKeypoints()) - np.float32(f.img_size) / 2
+            for f in features
+        ]
+        norm = cv.NORM_HAMMING if descriptors[0].dtype == np.uint8 else cv.NORM_L2
+        matcher = cv.BFMatcher(norm)
+
+        pairwise_matches = [TranslationMatcher.no_match() for _ in range(nr_imgs**2)]
+        for i, j in zip(*np.nonzero(np.triu(mask, k=1))):
+            match = self.match(
+                matcher, descriptors[i], descriptors[j], points[i], points[j]
+            )
+            match.src_img_idx, match.dst_img_idx = i, j
+            pairwise_matches[i * nr_imgs + j] = match
+            pairwise_matches[j * nr_imgs + i] = TranslationMatcher.dual(match)
+        return pairwise_matches
+
+    @staticmethod
+    def get_descriptors(features):
+        if isinstance(features.descriptors, cv.UMat):
+            return cv.UMat.get(features.descriptors)
+        return features.descriptors
+
+    def match(self, matcher, descriptors1, descriptors2, points1, points2):
+        matches = self.match_descriptors(matcher, descriptors1, descriptors2)
+        match = cv.detail.MatchesInfo()
+        match.matches = matches
+        if len(matches) < self.MIN_MATCHES:
+            return match
+
+        query_idx = np.array([m.queryIdx for m in matches])
+        train_idx = np.array([m.trainIdx for m in matches])
+        shifts = points2[train_idx] - points1[query_idx]
+        step = max(len(shifts) // self.MAX_CANDIDATES, 1)
+        candidates = shifts[::step, np.newaxis]
+        votes = np.sum(
+            np.linalg.norm(shifts - candidates, axis=2) < self.INLIER_THRESHOLD, axis=1
+        )
+        shift = candidates[np.argmax(votes), 0]
+        inliers = np.linalg.norm(shifts - shift, axis=1) < self.INLIER_THRESHOLD
+
+        match.H = np.eye(3)
+        match.H[:2, 2] = np.mean(shifts[inliers], axis=0)
+        match.inliers_mask = inliers.astype(np.uint8)
+        match.num_inliers = int(np.count_nonzero(inliers))
+        confidence = match.num_inliers / (8 + 0.3 * len(matches))
+        # too close images don't provide additional information (like in opencv)
+        match.confidence = 0 if confidence > 3 else confidence
+        return match
+
+    def match_descriptors(self, matcher, descriptors1, descriptors2):
+        """ratio test in both directions like opencv's matchers"""
+        matches, pairs = [], set()
+        ratio = 1 - self.match_conf
+        for m in matcher.knnMatch(descriptors1, descriptors2, k=2):
+            if len(m) == 2 and m[0].distance < ratio * m[1].distance:
+                matches.append(m[0])
+                pairs.add((m[0].queryIdx, m[0].trainIdx))
+        for m in matcher.knnMatch(descriptors2, descriptors1, k=2):
+            if len(m) == 2 and m[0].distance < ratio * m[1].distance:
+                if (m[0].trainIdx, m[0].queryIdx) not in pairs:
+                    matches.append(
+                        cv.DMatch(m[0].trainIdx, m[0].queryIdx, m[0].distance)
+                    )
+        return matches
+
+    def collectGarbage(self):
+        pass
+
+    @staticmethod
+    def dual(match):
+        dual = cv.detail.MatchesInfo()
+        dual.src_img_idx, dual.dst_img_idx = match.dst_img_idx, match.src_img_idx
+        dual.matches = [
+            cv.DMatch(m.trainIdx, m.queryIdx, m.distance) for m in match.matches
+        ]
+        if match.H is not None:
+            dual.H = np.linalg.inv(match.H)
+            dual.inliers_mask = match.inliers_mask
+            dual.num_inliers = match.num_inliers
+            dual.confidence = match.confidence
+        return dual
+
+    @staticmethod
+    def no_match():
+        match = cv.detail.MatchesInfo()
+        match.src_img_idx, match.dst_img_idx = -1, -1
+        return match
+
+
 class FeatureMatcher:
     """https://docs.opencv.org/4.x/da/d87/classcv_1_1detail_1_1FeaturesMatcher.html"""
 
-    MATCHER_CHOICES = ("homography", "affine")
+    MATCHER_CHOICES = ("homography", "affine", "translation")
     DEFAULT_MATCHER = "homography"
     DEFAULT_RANGE_WIDTH = -1
 
     def __init__(
         self, matcher_type=DEFAULT_MATCHER, range_width=DEFAULT_RANGE_WIDTH, **kwargs
     ):
-        if matcher_type == "affine":
+        if matcher_type == "translation":
+            self.matcher = TranslationMatcher(range_width, **kwargs)
+        elif matcher_type == "affine":
             self.matcher = cv.detail_AffineBestOf2NearestMatcher(**kwargs)
         elif range_width == -1:
             self.matcher = cv.detail_BestOf2NearestMatcher(**kwargs)
@@ -15,6 +15,7 @@ class Images(ABC):
         MEDIUM = 0.6
         LOW = 0.1
         FINAL = -1
+        SEAM = None  # the low resolution
 
     @staticmethod
     def of(
@@ -22,6 +23,7 @@ class Images(ABC):
         medium_megapix=Resolution.MEDIUM.value,
         low_megapix=Resolution.LOW.value,
         final_megapix=Resolution.FINAL.value,
+        seam_megapix=Resolution.SEAM.value,
     ):
         if not isinstance(images, list):
             raise StitchingError("images must be a list of images or filenames")
@@ -29,26 +31,41 @@ class Images(ABC):
             raise StitchingError("images must not be an empty list")
 
         if Images.check_list_element_types(images, np.ndarray):
-            return _NumpyImages(images, medium_megapix, low_megapix, final_megapix)
+            return _NumpyImages(
+                images, medium_megapix, low_megapix, final_megapix, seam_megapix
+            )
         elif Images.check_list_element_types(images, str):
-            return _FilenameImages(images, medium_megapix, low_megapix, final_megapix)
+            return _FilenameImages(
+                images, medium_megapix, low_megapix, final_megapix, seam_megapix
+            )
         else:
             raise StitchingError("""invalid images list:
                     must be numpy arrays (loaded images) or filename strings""")
 
     @abstractmethod
-    def __init__(self, images, medium_megapix, low_megapix, final_megapix):
+    def __init__(
+        self, images, medium_megapix, low_megapix, final_megapix, seam_megapix
+    ):
         if medium_megapix < low_megapix:
             raise StitchingError(
                 "Medium resolution megapix need to be "
                 "greater or equal than low resolution "
                 "megapix"
             )
+        if seam_megapix is None:
+            seam_megapix = low_megapix
+        if medium_megapix < seam_megapix:
+            raise StitchingError(
+                "Medium resolution megapix need to be "
+                "greater or equal than seam resolution "
+                "megapix"
+            )
 
         self._scalers = {}
         self._scalers["MEDIUM"] = MegapixDownscaler(medium_megapix)
         self._scalers["LOW"] = MegapixDownscaler(low_megapix)
         self._scalers["FINAL"] = MegapixDownscaler(final_megapix)
+        self._scalers["SEAM"] = MegapixDownscaler(seam_megapix)
         self._scales_set = False
 
         self._sizes_set = False
@@ -69,6 +86,14 @@ class Images(ABC):
         self._sizes = [self._sizes[i] for i in indices]
         self._names = [self._names[i] for i in indices]
 
+    @abstractmethod
+    def append(self, image):
+        pass
+
+    @abstractmethod
+    def replace(self, idx, image):
+        pass
+
     def resize(self, resolution, imgs=None):
         img_iterable = self.__iter__() if imgs is None else imgs
         for idx, img in enumerate(img_iterable):
@@ -76,10 +101,20 @@ class Images(ABC):
                 self._get_scaler(resolution), self._sizes[idx], img
             )
 
+    def resize_image(self, resolution, idx, img=None):
+        img = self[idx] if img is None else img
+        return Images.resize_img_by_scaler(
+            self._get_scaler(resolution), self.sizes[idx], img
+        )
+
     @abstractmethod
     def __iter__(self):
         pass
 
+    @abstractmethod
+    def __getitem__(self, idx):
+        pass
+
     def _set_scales(self, size):
         if not self._scales_set:
             for scaler in self._scalers.values():
@@ -90,6 +125,10 @@ class Images(ABC):
         Images.check_resolution(resolution)
         return self._scalers[resolution.name]
 
+    def get_scale(self, resolution):
+        assert self._scales_set
+        return self._get_scaler(resolution).scale
+
     def get_ratio(self, from_resolution, to_resolution):
         assert self._scales_set
         Images.check_resolution(from_resolution)
@@ -118,6 +157,13 @@ class Images(ABC):
         """(width, height)"""
         return (img.shape[1], img.shape[0])
 
+    @staticmethod
+    def check_same_size(size, new_size):
+        if size != new_size:
+            raise StitchingError(
+                f"The replacing image has size {new_size}, but {size} is needed"
+            )
+
     @staticmethod
     def resize_img_by_scaler(scaler, size, img):
         desired_size = scaler.get_scaled_img_size(size)
@@ -146,8 +192,12 @@ class Images(ABC):
 
 
 class _NumpyImages(Images):
-    def __init__(self, images, medium_megapix, low_megapix, final_megapix):
-        super().__init__(images, medium_megapix, low_megapix, final_megapix)
+    def __init__(
+        self, images, medium_megapix, low_megapix, final_megapix, seam_megapix
+    ):
+        super().__init__(
+            images, medium_megapix, low_megapix, final_megapix, seam_megapix
+        )
         if len(images) < 2:
             raise StitchingError("2 or more Images needed")
         self._images = images
@@ -161,14 +211,34 @@ class _NumpyImages(Images):
         super().subset(indices)
         self._images = [self._images[i] for i in indices]
 
+    def append(self, image):
+        if not isinstance(image, np.ndarray):
+            raise StitchingError("image must be a numpy array (loaded image)")
+        self._images.append(image)
+        self._sizes.append(Images.get_image_size(image))
+        self._names.append(str(len(self._names) + 1))
+
+    def replace(self, idx, image):
+        if not isinstance(image, np.ndarray):
+            raise StitchingError("image must be a numpy array (loaded image)")
+        Images.check_same_size(self.sizes[idx], Images.get_image_size(image))
+        self._images[idx] = image
+
     def __iter__(self):
         for img in self._images:
             yield img
 
+    def __getitem__(self, idx):
+        return self._images[idx]
+
 
 class _FilenameImages(Images):
-    def __init__(self, images, medium_megapix, low_megapix, final_megapix):
-        super().__init__(images, medium_megapix, low_megapix, final_megapix)
+    def __init__(
+        self, images, medium_megapix, low_megapix, final_megapix, seam_megapix
+    ):
+        super().__init__(
+            images, medium_megapix, low_megapix, final_megapix, seam_megapix
+        )
         self._names = Images.resolve_wildcards(images)
         self._names_set = True
         if len(self.names) < 2:
@@ -178,6 +248,20 @@ class _FilenameImages(Images):
     def subset(self, indices):
         super().subset(indices)
 
+    def append(self, image):
+        if not isinstance(image, str):
+            raise StitchingError("image must be a filename string")
+        assert self._sizes_set
+        self._sizes.append(Images.get_image_size(Images.read_image(image)))
+        self._names.append(image)
+
+    def replace(self, idx, image):
+        if not isinstance(image, str):
+            raise StitchingError("image must be a filename string")
+        size = Images.get_image_size(Images.read_image(image))
+        Images.check_same_size(self.sizes[idx], size)
+        self._names[idx] = image
+
     def __iter__(self):
         for idx, name in enumerate(self.names):
             img = Images.read_image(name)
@@ -196,3 +280,6 @@ class _FilenameImages(Images):
             # ------
 
             yield img
+
+    def __getitem__(self, idx):
+        return Images.read_image(self.names[idx])
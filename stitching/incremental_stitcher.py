@@ -0,0 +1,439 @@
+import cv2 as cv
+import numpy as np
+
+from .blender import Blender
+from .camera_loader import CameraLoader
+from .cropper import Rectangle, crop, get_intersection, get_union, grow
+from .exposure_error_compensator import ExposureErrorCompensator
+from .images import Images
+from .seam_finder import SeamFinder
+from .stitcher import Stitcher
+from .stitching_error import StitchingError
+from .tiled_blender import TiledBlender
+
+
+class IncrementalStitcher(Stitcher):
+    """Keeps the state of the last stitch (features, matches, cameras, warped
+    low resolution images, seam masks and exposure compensation) so that
+    images can be added to the panorama without rerunning the whole pipeline.
+
+    The cameras of the already stitched images are kept fixed. A new image is
+    only registered against its overlapping neighbours and only the affected
+    area of the panorama is composited again. The warped and compensated
+    final resolution images are kept as well, so only the added or replaced
+    image is warped again."""
+
+    INCREMENTAL_DEFAULTS = {"crop": False}
+
+    DEFAULT_SETTINGS = Stitcher.DEFAULT_SETTINGS.copy()
+    DEFAULT_SETTINGS.update(INCREMENTAL_DEFAULTS)
+
+    def initialize_stitcher(self, **kwargs):
+        super().initialize_stitcher(**kwargs)
+        if self.cropper.do_crop:
+            raise StitchingError("Incremental stitching does not support cropping")
+        if self.timelapser.do_timelapse:
+            raise StitchingError("Incremental stitching does not support timelapse")
+        if self.seam_megapix is not None:
+            raise StitchingError(
+                "Incremental stitching does not support a separate seam resolution"
+            )
+        if isinstance(self.blender, TiledBlender):
+            raise StitchingError(
+                "Incremental stitching does not support tiled blending"
+            )
+        self.panorama = None
+
+    # The pipeline of Stitcher.stitch is reused, its steps keep the state
+
+    def match_features(self, features):
+        matches = super().match_features(features)
+        self.set_features_and_matches(len(features), features, matches)
+        return matches
+
+    def subset(self, imgs, features, matches):
+        imgs, features, matches = super().subset(imgs, features, matches)
+        self.set_features_and_matches(len(features), features, matches)
+        return imgs, features, matches
+
+    def scale_given_camera_parameters(self, cameras):
+        cameras = super().scale_given_camera_parameters(cameras)
+        self.set_features_and_matches(len(cameras), None, None)
+        return cameras
+
+    def perform_wave_correction(self, cameras):
+        uncorrected_rotation = np.copy(cameras[0].R)
+        cameras = super().perform_wave_correction(cameras)
+        self.wave_correction = cameras[0].R @ np.linalg.inv(uncorrected_rotation)
+        self.cameras = list(cameras)
+        return cameras
+
+    def crop_low_resolution(self, imgs, masks, corners, sizes):
+        imgs, masks, corners, sizes = super().crop_low_resolution(
+            imgs, masks, corners, sizes
+        )
+        self.low_imgs, self.low_masks = imgs, masks
+        self.low_corners, self.low_sizes = list(corners), list(sizes)
+        return imgs, masks, corners, sizes
+
+    def estimate_exposure_errors(self, corners, imgs, masks):
+        super().estimate_exposure_errors(corners, imgs, masks)
+        self.compensations = [(self.compensator, idx) for idx in range(len(imgs))]
+
+    def set_masks(self, mask_generator):
+        self.final_masks = []
+        super().set_masks(mask_generator)
+
+    def get_mask(self, idx):
+        mask = super().get_mask(idx)
+        set_item(self.final_masks, idx, mask)
+        return mask
+
+    def compensate_exposure_errors(self, corners, imgs):
+        self.final_imgs = []
+        for img in super().compensate_exposure_errors(corners, imgs):
+            self.final_imgs.append(img)
+            yield img
+
+    def resize_seam_masks(self, seam_masks):
+        self.low_seam_masks = [cv.UMat.get(seam_mask) for seam_mask in seam_masks]
+        return super().resize_seam_masks(self.low_seam_masks)
+
+    def initialize_composition(self, corners, sizes):
+        self.final_corners, self.final_sizes = list(corners), list(sizes)
+        super().initialize_composition(corners, sizes)
+
+    def create_final_panorama(self):
+        self.panorama, self.panorama_mask = self.blender.blend()
+        self.panorama_roi = Rectangle(
+            *cv.detail.resultRoi(corners=self.final_corners, sizes=self.final_sizes)
+        )
+        self.blend_width = self.blender.blend_width
+        return self.panorama
+
+    def add_image(self, image, camera=None):
+        """Adds an image (numpy array or filename) to the panorama of the last
+        stitch and returns the updated panorama. If the camera of the image is
+        known (see CameraLoader), the registration is skipped (see also the
+        refine_given_cameras setting)."""
+        if self.panorama is None:
+            raise StitchingError("Images can only be added after stitch()")
+        idx = len(self.cameras)
+        self.images.append(image)
+        self.features.append(None)
+        medium_img = self.images.resize_image(Images.Resolution.MEDIUM, idx)
+
+        if camera is None:
+            camera = self.estimate_new_camera(idx, medium_img)
+        else:
+            camera = self.prepare_new_camera(idx, medium_img, camera)
+        self.cameras.append(camera)
+
+        return self.update_panorama(idx, medium_img)
+
+    def replace_image(self, idx, image):
+        """Replaces the image at idx (e.g. a retaken image of the same camera)
+        keeping its camera and returns the updated panorama. Only the area of
+        the image is composited again."""
+        if self.panorama is None:
+            raise StitchingError("Images can only be replaced after stitch()")
+        if not 0 <= idx < len(self.cameras):
+            raise StitchingError(f"No image with index {idx} in the panorama")
+        self.images.replace(idx, image)
+        self.features[idx] = None
+        self.matches = {
+            pair: match for pair, match in self.matches.items() if idx not in pair
+        }
+        medium_img = self.images.resize_image(Images.Resolution.MEDIUM, idx)
+        return self.update_panorama(idx, medium_img)
+
+    def prepare_new_camera(self, idx, medium_img, camera):
+        camera = CameraLoader.rescale(
+            [camera],
+            self.images.get_scale(Images.Resolution.MEDIUM),
+            affine=self.warper.warper_type == "affine",
+        )[0]
+        camera.R = (self.wave_correction @ camera.R).astype(np.float32)
+        if not self.refine_given_cameras:
+            return camera
+
+        low_roi = self.get_low_roi(idx, camera)
+        candidates = [
+            i for i in range(idx) if get_intersection(self.get_low_rect(i), low_roi)
+        ]
+        neighbours = self.match_new_image(idx, medium_img, candidates)
+        indices = neighbours + [idx]
+        features = self.features_of(indices)
+        matches = self.matches_of(indices)
+        cameras = [self.cameras[i] for i in neighbours] + [camera]
+        cameras = self.refine_camera_parameters(features, matches, cameras)
+        return self.align_camera(cameras, neighbours)
+
+    def estimate_new_camera(self, idx, medium_img):
+        neighbours = self.match_new_image(idx, medium_img, list(range(idx)))
+        camera = self.camera_from_homography(neighbours[0], idx, medium_img)
+        indices = neighbours + [idx]
+        features = self.features_of(indices)
+        matches = self.matches_of(indices)
+        cameras = CameraLoader.rescale([self.cameras[i] for i in neighbours], 1)
+        cameras = self.refine_camera_parameters(features, matches, cameras + [camera])
+        return self.align_camera(cameras, neighbours)
+
+    def camera_from_homography(self, anchor_idx, idx, medium_img):
+        """Chains the camera of the anchor with the homography between the
+        anchor and the new image (like the camera estimators do)"""
+        anchor = self.cameras[anchor_idx]
+        H = self.matches[(anchor_idx, idx)].H
+        if self.warper.warper_type == "affine":
+            return CameraLoader.create_camera(np.eye(3), anchor.R @ H)
+        K = np.diag([anchor.focal, anchor.focal * anchor.aspect, 1.0])
+        R = anchor.R @ np.linalg.inv(K) @ np.linalg.inv(H) @ K
+        width, height = Images.get_image_size(medium_img)
+        K[0, 2], K[1, 2] = width / 2, height / 2
+        return CameraLoader.create_camera(K, R)
+
+    def match_new_image(self, idx, medium_img, candidates):
+        """Matches the new image only with the candidates and returns the
+        candidates exceeding the confidence threshold ordered by confidence"""
+        self.features[idx] = self.detector.detect_features(medium_img)
+        self.match_pairs([(i, idx) for i in candidates])
+        confidences = [self.matches[(i, idx)].confidence for i in candidates]
+        neighbours = [
+            i
+            for confidence, i in sorted(zip(confidences, candidates), reverse=True)
+            if confidence > self.subsetter.confidence_threshold
+        ]
+        if len(neighbours) == 0:
+            raise StitchingError(
+                "No match of the new image exceeds the given confidence threshold."
+            )
+        return neighbours
+
+    def align_camera(self, local_cameras, neighbours):
+        """Transforms the new (last) of the locally estimated cameras into the
+        frame of the panorama using the best matching neighbour. If the local
+        adjustment changed the focal length of the neighbour, the rotation
+        between them is scaled so that the new image keeps its position in
+        pixels relative to the neighbour"""
+        local_anchor, camera = local_cameras[0], local_cameras[-1]
+        anchor = self.cameras[neighbours[0]]
+        scale = anchor.focal / local_anchor.focal
+        rotation = np.linalg.inv(local_anchor.R.astype(np.float64)) @ camera.R
+        if scale != 1:
+            rvec, _ = cv.Rodrigues(rotation)
+            rotation, _ = cv.Rodrigues(rvec / scale)
+        camera.R = (anchor.R @ rotation).astype(np.float32)
+        camera.focal *= scale
+        return camera
+
+    def set_features_and_matches(self, nr_imgs, features, matches):
+        self.features = [None] * nr_imgs if features is None else features
+        self.matches = {}
+        if matches is not None:
+            for i in range(nr_imgs):
+                for j in range(nr_imgs):
+                    if i != j:
+                        self.matches[(i, j)] = matches[i * nr_imgs + j]
+
+    def features_of(self, indices):
+        for idx in indices:
+            if self.features[idx] is None:
+                img = self.images.resize_image(Images.Resolution.MEDIUM, idx)
+                self.features[idx] = self.detector.detect_features(img)
+        return [self.features[idx] for idx in indices]
+
+    def match_pairs(self, pairs):
+        pairs = [pair for pair in pairs if pair not in self.matches]
+        if len(pairs) == 0:
+            return
+        indices = sorted(set(idx for pair in pairs for idx in pair))
+        features = self.features_of(indices)
+        position = {idx: pos for pos, idx in enumerate(indices)}
+        mask = np.zeros((len(indices), len(indices)), np.uint8)
+        for i, j in pairs:
+            mask[min(position[i], position[j]), max(position[i], position[j])] = 1
+        matches = self.matcher.match_features(features, mask=mask)
+        for i, j in pairs:
+            self.matches[(i, j)] = matches[position[i] * len(indices) + position[j]]
+            self.matches[(j, i)] = matches[position[j] * len(indices) + position[i]]
+
+    def matches_of(self, indices):
+        self.match_pairs([(i, j) for i in indices for j in indices if i < j])
+        return [
+            self.matches[(i, j)] if i != j else cv.detail.MatchesInfo()
+            for i in indices
+            for j in indices
+        ]
+
+    def update_panorama(self, idx, medium_img):
+        """Warps the image at low resolution, updates the seams and the exposure
+        compensation with its neighbours and composites the affected area"""
+        low_img = self.images.resize_image(Images.Resolution.LOW, idx, medium_img)
+        low_size = self.images.get_scaled_img_sizes(Images.Resolution.LOW)[idx]
+        aspect = self.images.get_ratio(Images.Resolution.MEDIUM, Images.Resolution.LOW)
+        imgs, masks, corners, sizes = self.warp(
+            [low_img], [self.cameras[idx]], [low_size], aspect
+        )
+        set_item(self.low_imgs, idx, next(imgs))
+        set_item(self.low_masks, idx, next(masks))
+        set_item(self.low_corners, idx, corners[0])
+        set_item(self.low_sizes, idx, sizes[0])
+
+        low_rect = self.get_low_rect(idx)
+        neighbours = [
+            i
+            for i in range(len(self.cameras))
+            if i != idx and get_intersection(self.get_low_rect(i), low_rect)
+        ]
+        self.update_seam_masks(idx, neighbours)
+        self.update_exposure_compensation(idx, neighbours)
+
+        final_size = self.images.get_scaled_img_sizes(Images.Resolution.FINAL)[idx]
+        aspect = self.images.get_ratio(
+            Images.Resolution.MEDIUM, Images.Resolution.FINAL
+        )
+        corners, sizes = self.warper.warp_rois(
+            [final_size], [self.cameras[idx]], aspect
+        )
+        set_item(self.final_corners, idx, corners[0])
+        set_item(self.final_sizes, idx, sizes[0])
+        set_item(self.final_imgs, idx, None)
+        set_item(self.final_masks, idx, None)
+
+        self.update_composition(idx)
+        return self.panorama
+
+    def update_seam_masks(self, idx, neighbours):
+        """The neighbours regain their parts of the overlap with the image,
+        then the seams are estimated between the image and its neighbours"""
+        indices = [idx] + neighbours
+        masks = [self.low_masks[idx]]
+        for i in neighbours:
+            mask = np.copy(self.low_seam_masks[i])
+            overlap = get_intersection(self.get_low_rect(i), self.get_low_rect(idx))
+            region = crop(mask, overlap, self.low_corners[i])
+            full_mask = crop(self.low_masks[i], overlap, self.low_corners[i])
+            img_mask = crop(self.low_masks[idx], overlap, self.low_corners[idx])
+            region |= full_mask & img_mask
+            masks.append(mask)
+
+        seam_masks = self.find_seam_masks(
+            [self.low_imgs[i] for i in indices],
+            [self.low_corners[i] for i in indices],
+            masks,
+        )
+        for i, seam_mask in zip(indices, seam_masks):
+            set_item(self.low_seam_masks, i, cv.UMat.get(seam_mask))
+
+    def update_exposure_compensation(self, idx, neighbours):
+        """The image is compensated against its already compensated neighbours"""
+        if len(neighbours) == 0:
+            set_item(self.compensations, idx, None)
+            return
+        imgs = [
+            self.apply_compensation(
+                i, self.low_corners[i], np.copy(self.low_imgs[i]), self.low_masks[i]
+            )
+            for i in neighbours
+        ]
+        indices = neighbours + [idx]
+        compensator = ExposureErrorCompensator(
+            self.settings["compensator"],
+            self.settings["nr_feeds"],
+            self.settings["block_size"],
+        )
+        compensator.feed(
+            [self.low_corners[i] for i in indices],
+            imgs + [self.low_imgs[idx]],
+            [self.low_masks[i] for i in indices],
+        )
+        set_item(self.compensations, idx, (compensator, len(neighbours)))
+
+    def apply_compensation(self, idx, corner, img, mask):
+        if self.compensations[idx] is None:
+            return img
+        compensator, compensator_idx = self.compensations[idx]
+        return compensator.apply(compensator_idx, corner, img, mask)
+
+    def update_composition(self, idx):
+        """Blends the area of the image (plus a margin covering the blending
+        transitions) and pastes it into the panorama"""
+        self.extend_panorama(self.get_final_rect(idx))
+        margin = int(np.ceil(self.blend_width))
+        paste_roi = get_intersection(
+            grow(self.get_final_rect(idx), margin), self.panorama_roi
+        )
+        blend_roi = get_intersection(grow(paste_roi, margin), self.panorama_roi)
+        blend_roi = self.blender.align_to_pyramid(blend_roi, self.panorama_roi.corner)
+
+        blender = Blender(self.blender.blender_type, self.blender.blend_strength)
+        blender.prepare_roi(blend_roi, self.blend_width)
+        for i in range(len(self.cameras)):
+            overlap = get_intersection(self.get_final_rect(i), blend_roi)
+            if overlap is None:
+                continue
+            img, mask = self.warp_final_image(i)
+            seam_mask = SeamFinder.resize(self.low_seam_masks[i], mask)
+            blender.feed(
+                crop(img, overlap, self.final_corners[i]),
+                crop(seam_mask, overlap, self.final_corners[i]),
+                overlap.corner,
+            )
+        result, result_mask = blender.blend()
+
+        result_roi = Rectangle(*blend_roi.corner, result.shape[1], result.shape[0])
+        crop(self.panorama, paste_roi, self.panorama_roi.corner)[:] = crop(
+            result, paste_roi, result_roi.corner
+        )
+        crop(self.panorama_mask, paste_roi, self.panorama_roi.corner)[:] = crop(
+            result_mask, paste_roi, result_roi.corner
+        )
+
+    def warp_final_image(self, idx):
+        """The warped and compensated final resolution image and its mask,
+        kept until the image is replaced"""
+        if self.final_imgs[idx] is not None:
+            return self.final_imgs[idx], self.final_masks[idx]
+        img = self.images.resize_image(Images.Resolution.FINAL, idx)
+        size = Images.get_image_size(img)
+        aspect = self.images.get_ratio(
+            Images.Resolution.MEDIUM, Images.Resolution.FINAL
+        )
+        imgs, masks, corners, _ = self.warp([img], [self.cameras[idx]], [size], aspect)
+        mask = next(masks)
+        img = self.apply_compensation(idx, corners[0], next(imgs), mask)
+        self.final_imgs[idx], self.final_masks[idx] = img, mask
+        return img, mask
+
+    def extend_panorama(self, rect):
+        roi = get_union(self.panorama_roi, rect)
+        if roi == self.panorama_roi:
+            return
+        panorama = np.zeros((roi.height, roi.width, 3), self.panorama.dtype)
+        panorama_mask = np.zeros((roi.height, roi.width), self.panorama_mask.dtype)
+        crop(panorama, self.panorama_roi, roi.corner)[:] = self.panorama
+        crop(panorama_mask, self.panorama_roi, roi.corner)[:] = self.panorama_mask
+        self.panorama, self.panorama_mask, self.panorama_roi = (
+            panorama,
+            panorama_mask,
+            roi,
+        )
+
+    def get_low_roi(self, idx, camera):
+        low_size = self.images.get_scaled_img_sizes(Images.Resolution.LOW)[idx]
+        aspect = self.images.get_ratio(Images.Resolution.MEDIUM, Images.Resolution.LOW)
+        corners, sizes = self.warper.warp_rois([low_size], [camera], aspect)
+        return Rectangle(*corners[0], *sizes[0])
+
+    def get_low_rect(self, idx):
+        return Rectangle(*self.low_corners[idx], *self.low_sizes[idx])
+
+    def get_final_rect(self, idx):
+        return Rectangle(*self.final_corners[idx], *self.final_sizes[idx])
+
+
+def set_item(list_, idx, item):
+    if idx == len(list_):
+        list_.append(item)
+    else:
+        list_[idx] = item
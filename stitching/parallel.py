@@ -0,0 +1,21 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def parallel_map(function, *iterables, nr_workers=1):
+    """Like map, but calls the function in nr_workers threads (opencv releases
+    the GIL). The results are yielded in order. To cap the memory, the
+    iterables are consumed lazily and at most 2 * nr_workers items are
+    processed or waiting to be consumed at the same time"""
+    if nr_workers <= 1:
+        yield from map(function, *iterables)
+        return
+
+    with ThreadPoolExecutor(nr_workers) as executor:
+        futures = deque()
+        for args in zip(*iterables):
+            if len(futures) == 2 * nr_workers:
+                yield futures.popleft().result()
+            futures.append(executor.submit(function, *args))
+        while futures:
+            yield futures.popleft().result()
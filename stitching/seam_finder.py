@@ -1,39 +1,142 @@
+import threading
 import warnings
 from collections import OrderedDict
+from functools import partial
 
 import cv2 as cv
 import numpy as np
 
-from .blender import Blender
+from .cropper import Rectangle, RoiIndex, crop, get_intersection, grow
+from .parallel import parallel_map
 from .stitching_error import StitchingWarning
 
 
 class SeamFinder:
     """https://docs.opencv.org/4.x/d7/d09/classcv_1_1detail_1_1SeamFinder.html"""
 
+    # the finders are created when selected
     SEAM_FINDER_CHOICES = OrderedDict()
-    SEAM_FINDER_CHOICES["dp_color"] = cv.detail_DpSeamFinder("COLOR")
-    SEAM_FINDER_CHOICES["dp_colorgrad"] = cv.detail_DpSeamFinder("COLOR_GRAD")
-    SEAM_FINDER_CHOICES["gc_color"] = cv.detail_GraphCutSeamFinder("COST_COLOR")
-    SEAM_FINDER_CHOICES["gc_colorgrad"] = cv.detail_GraphCutSeamFinder(
-        "COST_COLOR_GRAD"
+    SEAM_FINDER_CHOICES["dp_color"] = partial(cv.detail_DpSeamFinder, "COLOR")
+    SEAM_FINDER_CHOICES["dp_colorgrad"] = partial(cv.detail_DpSeamFinder, "COLOR_GRAD")
+    SEAM_FINDER_CHOICES["gc_color"] = partial(
+        cv.detail_GraphCutSeamFinder, "COST_COLOR"
     )
-    SEAM_FINDER_CHOICES["voronoi"] = cv.detail.SeamFinder_createDefault(
-        cv.detail.SeamFinder_VORONOI_SEAM
+    SEAM_FINDER_CHOICES["gc_colorgrad"] = partial(
+        cv.detail_GraphCutSeamFinder, "COST_COLOR_GRAD"
     )
-    SEAM_FINDER_CHOICES["no"] = cv.detail.SeamFinder_createDefault(
-        cv.detail.SeamFinder_NO
+    SEAM_FINDER_CHOICES["voronoi"] = partial(
+        cv.detail.SeamFinder_createDefault, cv.detail.SeamFinder_VORONOI_SEAM
+    )
+    SEAM_FINDER_CHOICES["no"] = partial(
+        cv.detail.SeamFinder_createDefault, cv.detail.SeamFinder_NO
     )
 
     DEFAULT_SEAM_FINDER = list(SEAM_FINDER_CHOICES.keys())[0]
 
-    def __init__(self, finder=DEFAULT_SEAM_FINDER):
-        self.finder = SeamFinder.SEAM_FINDER_CHOICES[finder]
+    DEFAULT_OVERLAP_BANDS = False
+    DEFAULT_NR_WORKERS = 1
+    # opencv's pairwise seam finders look 10 pixels beyond the overlap
+    OVERLAP_BAND_MARGIN = 10
+    # finders which find the same seams in uint8 and float32 images
+    UINT8_SEAM_FINDERS = ("dp_color", "voronoi", "no")
+
+    def __init__(
+        self,
+        finder=DEFAULT_SEAM_FINDER,
+        overlap_bands=DEFAULT_OVERLAP_BANDS,
+        nr_workers=DEFAULT_NR_WORKERS,
+    ):
+        self.finder_type = finder
+        self.finder = SeamFinder.SEAM_FINDER_CHOICES[finder]()
+        self.local = threading.local()
+        self.overlap_bands = overlap_bands
+        self.nr_workers = nr_workers
+        if finder in SeamFinder.UINT8_SEAM_FINDERS:
+            self.band_dtype = np.uint8
+        else:
+            self.band_dtype = np.float32
+
+    def get_finder(self):
+        """The opencv finder of the current thread (opencv finders keep state
+        while finding the seams), released with the thread"""
+        if not hasattr(self.local, "finder"):
+            self.local.finder = SeamFinder.SEAM_FINDER_CHOICES[self.finder_type]()
+        return self.local.finder
 
     def find(self, imgs, corners, masks):
+        if self.overlap_bands:
+            return self.find_in_overlap_bands(imgs, corners, masks)
         imgs_float = [img.astype(np.float32) for img in imgs]
         return self.finder.find(imgs_float, corners, masks)
 
+    def find_in_overlap_bands(self, imgs, corners, masks):
+        """Finds the seams pair by pair (as opencv does), but the finder only
+        gets the overlap of the pair and a margin around it. The graph cut and
+        voronoi seams are identical to the seams of the whole images. The dp
+        seams can differ slightly where a band cuts an image region apart.
+        Pairs without common images are processed in parallel"""
+        seam_masks = [
+            cv.UMat.get(mask) if isinstance(mask, cv.UMat) else np.copy(mask)
+            for mask in masks
+        ]
+        find_in_overlap_band = partial(
+            self.find_in_overlap_band, imgs=imgs, corners=corners, masks=seam_masks
+        )
+        pairs = self.get_overlapping_pairs(imgs, corners)
+        for batch in SeamFinder.schedule_pairs(pairs):
+            # the pairs of a batch update different masks
+            list(parallel_map(find_in_overlap_band, batch, nr_workers=self.nr_workers))
+        return [cv.UMat(seam_mask) for seam_mask in seam_masks]
+
+    def find_in_overlap_band(self, pair, imgs, corners, masks):
+        """Updates the masks of the pair with the seam found in its band"""
+        rectangles = [Rectangle(*corners[i], *imgs[i].shape[1::-1]) for i in pair]
+        band = grow(get_intersection(*rectangles), SeamFinder.OVERLAP_BAND_MARGIN)
+        bands = [get_intersection(band, rectangle) for rectangle in rectangles]
+        band_imgs = [
+            crop(imgs[i], rectangle, corners[i]).astype(self.band_dtype)
+            for i, rectangle in zip(pair, bands)
+        ]
+        band_masks = [
+            crop(masks[i], rectangle, corners[i]) for i, rectangle in zip(pair, bands)
+        ]
+        band_corners = [rectangle.corner for rectangle in bands]
+        band_seam_masks = self.get_finder().find(band_imgs, band_corners, band_masks)
+        for band_mask, band_seam_mask in zip(band_masks, band_seam_masks):
+            band_mask[:] = cv.UMat.get(band_seam_mask)
+
+    def get_overlapping_pairs(self, imgs, corners):
+        """The overlapping pairs in the order in which opencv processes them"""
+        sizes = [img.shape[1::-1] for img in imgs]
+        pairs = RoiIndex.of(corners, sizes).overlapping_pairs()
+        if isinstance(self.finder, cv.detail_DpSeamFinder):
+            # the dp finder starts with the most distant images
+            centers = [
+                (x + img.shape[1] // 2, y + img.shape[0] // 2)
+                for (x, y), img in zip(corners, imgs)
+            ]
+            pairs.sort(key=lambda pair: squared_distance(*(centers[i] for i in pair)))
+            pairs.reverse()
+        return pairs
+
+    @staticmethod
+    def schedule_pairs(pairs):
+        """Splits the pairs into batches of pairs without common images (a
+        greedy edge coloring of the overlap graph). A pair is put into the
+        batch after the last batch with one of its images, so that every mask
+        is updated in the order of the pairs and the seams don't depend on the
+        parallelization"""
+        batches = []
+        next_batch = {}
+        for pair in pairs:
+            batch = max(next_batch.get(i, 0) for i in pair)
+            if batch == len(batches):
+                batches.append([])
+            batches[batch].append(pair)
+            for i in pair:
+                next_batch[i] = batch + 1
+        return batches
+
     @staticmethod
     def resize(seam_mask, mask):
         dilated_mask = cv.dilate(seam_mask, None)
@@ -63,10 +166,7 @@ class SeamFinder:
     @staticmethod
     def extract_seam_lines(blended_seam_masks, linesize=1):
         seam_lines = cv.Canny(np.uint8(blended_seam_masks), 100, 200)
-        seam_indices = (seam_lines == 255).nonzero()
-        seam_lines = remove_invalid_line_pixels(
-            seam_indices, seam_lines, blended_seam_masks
-        )
+        seam_lines = remove_invalid_line_pixels(seam_lines, blended_seam_masks)
         kernelsize = linesize + linesize - 1
         kernel = np.ones((kernelsize, kernelsize), np.uint8)
         return cv.dilate(seam_lines, kernel)
@@ -88,59 +188,46 @@ class SeamFinder:
             (000, 128, 255),  # Light Blue
         ),
     ):
-        imgs = colored_img_generator(sizes, colors)
-        blended_seam_masks, _ = Blender.create_panorama(
-            imgs, seam_masks, corners, sizes
-        )
+        """The seam masks colored and placed at their corners, equal to
+        Blender.create_panorama of images filled with the colors"""
+        if len(sizes) + 1 > len(colors):
+            warnings.warn(
+                "Without additional colors, there will be seam masks with identical colors",  # noqa: E501
+                StitchingWarning,
+            )
+        x, y, width, height = cv.detail.resultRoi(corners=corners, sizes=sizes)
+        blended_seam_masks = np.zeros((height, width, 3), np.uint8)
+        for idx, (seam_mask, corner) in enumerate(zip(seam_masks, corners)):
+            if isinstance(seam_mask, cv.UMat):
+                seam_mask = cv.UMat.get(seam_mask)
+            rectangle = Rectangle(*corner, seam_mask.shape[1], seam_mask.shape[0])
+            region = crop(blended_seam_masks, rectangle, (x, y))
+            region[seam_mask > 0] = colors[idx % len(colors)]
         return blended_seam_masks
 
 
-def colored_img_generator(sizes, colors):
-    if len(sizes) + 1 > len(colors):
-        warnings.warn(
-            "Without additional colors, there will be seam masks with identical colors",  # noqa: E501
-            StitchingWarning,
-        )
-
-    for idx, size in enumerate(sizes):
-        yield create_img_by_size(size, colors[idx % len(colors)])
-
-
-def create_img_by_size(size, color=(0, 0, 0)):
-    width, height = size
-    img = np.zeros((height, width, 3), np.uint8)
-    img[:] = color
-    return img
+def squared_distance(point1, point2):
+    return (point1[0] - point2[0]) ** 2 + (point1[1] - point2[1]) ** 2
 
 
 def add_weighted_image(img1, img2, alpha):
     return cv.addWeighted(img1, alpha, img2, (1.0 - alpha), 0.0)
 
 
-def remove_invalid_line_pixels(indices, lines, mask):
-    for x, y in zip(*indices):
-        if check_if_pixel_or_neighbor_is_black(mask, x, y):
-            lines[x, y] = 0
+def remove_invalid_line_pixels(lines, mask):
+    """Removes the line pixels which are black in the mask or have a black
+    neighbour. The neighbour above the first row is the last row (and left
+    of the first column the last column), below the last row (right of the
+    last column) there is no neighbour"""
+    height, width = lines.shape[:2]
+    ys, xs = lines.nonzero()
+    invalid = np.zeros(len(ys), bool)
+    for dy, dx in ((0, 0), (1, 0), (-1, 0), (0, 1), (0, -1)):
+        neighbour_ys, neighbour_xs = ys + dy, xs + dx
+        inside = (neighbour_ys < height) & (neighbour_xs < width)
+        black = mask[neighbour_ys[inside], neighbour_xs[inside]] == 0
+        if black.ndim == 2:
+            black = black.all(axis=1)
+        invalid[inside] |= black
+    lines[ys[invalid], xs[invalid]] = 0
     return lines
-
-
-def check_if_pixel_or_neighbor_is_black(img, x, y):
-    check = [
-        is_pixel_black(img, x, y),
-        is_pixel_black(img, x + 1, y),
-        is_pixel_black(img, x - 1, y),
-        is_pixel_black(img, x, y + 1),
-        is_pixel_black(img, x, y - 1),
-    ]
-    return any(check)
-
-
-def is_pixel_black(img, x, y):
-    return np.all(get_pixel_value(img, x, y) == 0)
-
-
-def get_pixel_value(img, x, y):
-    try:
-        return img[x, y]
-    except IndexError:
-        pass
@@ -1,9 +1,11 @@
 import warnings
+from itertools import tee
 from types import SimpleNamespace
 
 from .blender import Blender
 from .camera_adjuster import CameraAdjuster
 from .camera_estimator import CameraEstimator
+from .camera_loader import CameraLoader
 from .camera_wave_corrector import WaveCorrector
 from .cropper import Cropper
 from .exposure_error_compensator import ExposureErrorCompensator
@@ -13,12 +15,18 @@ from .images import Images
 from .seam_finder import SeamFinder
 from .stitching_error import StitchingError, StitchingWarning
 from .subsetter import Subsetter
+from .tiled_blender import TiledBlender
 from .timelapser import Timelapser
 from .verbose import verbose_stitching
 from .warper import Warper
 
 
 class Stitcher:
+    """Every Stitcher creates its own components, so several Stitchers can
+    stitch concurrently in different threads. A single Stitcher keeps the
+    state of its current stitch and must not be used by several threads at
+    the same time."""
+
     DEFAULT_SETTINGS = {
         "medium_megapix": Images.Resolution.MEDIUM.value,
         "detector": FeatureDetector.DEFAULT_DETECTOR,
@@ -32,17 +40,31 @@ class Stitcher:
         "estimator": CameraEstimator.DEFAULT_CAMERA_ESTIMATOR,
         "adjuster": CameraAdjuster.DEFAULT_CAMERA_ADJUSTER,
         "refinement_mask": CameraAdjuster.DEFAULT_REFINEMENT_MASK,
+        "adjuster_cluster_size": CameraAdjuster.DEFAULT_CLUSTER_SIZE,
+        "adjuster_max_iterations": CameraAdjuster.DEFAULT_MAX_ITERATIONS,
+        "adjuster_epsilon": CameraAdjuster.DEFAULT_EPSILON,
+        "adjuster_time_budget": CameraAdjuster.DEFAULT_TIME_BUDGET,
+        "refine_given_cameras": False,
         "wave_correct_kind": WaveCorrector.DEFAULT_WAVE_CORRECTION,
         "warper_type": Warper.DEFAULT_WARP_TYPE,
+        "nr_workers": Warper.DEFAULT_NR_WORKERS,
         "low_megapix": Images.Resolution.LOW.value,
+        "seam_megapix": Images.Resolution.SEAM.value,
         "crop": Cropper.DEFAULT_CROP,
         "compensator": ExposureErrorCompensator.DEFAULT_COMPENSATOR,
         "nr_feeds": ExposureErrorCompensator.DEFAULT_NR_FEEDS,
         "block_size": ExposureErrorCompensator.DEFAULT_BLOCK_SIZE,
+        "compensator_update_interval": ExposureErrorCompensator.DEFAULT_UPDATE_INTERVAL,
+        "gain_smoothing": ExposureErrorCompensator.DEFAULT_GAIN_SMOOTHING,
+        "brightness_drift": ExposureErrorCompensator.DEFAULT_BRIGHTNESS_DRIFT,
         "finder": SeamFinder.DEFAULT_SEAM_FINDER,
+        "overlap_bands": SeamFinder.DEFAULT_OVERLAP_BANDS,
         "final_megapix": Images.Resolution.FINAL.value,
         "blender_type": Blender.DEFAULT_BLENDER,
         "blend_strength": Blender.DEFAULT_BLEND_STRENGTH,
+        "blend_tile_size": None,
+        "blend_tmp_dir": None,
+        "blend_in_memory": False,
         "timelapse": Timelapser.DEFAULT_TIMELAPSE,
         "timelapse_prefix": Timelapser.DEFAULT_TIMELAPSE_PREFIX,
     }
@@ -59,7 +81,9 @@ class Stitcher:
         args = SimpleNamespace(**self.settings)
         self.medium_megapix = args.medium_megapix
         self.low_megapix = args.low_megapix
+        self.seam_megapix = args.seam_megapix
         self.final_megapix = args.final_megapix
+        self.refine_given_cameras = args.refine_given_cameras
         if args.detector in ("orb", "sift"):
             self.detector = FeatureDetector(args.detector, nfeatures=args.nfeatures)
         else:
@@ -76,35 +100,73 @@ class Stitcher:
         )
         self.camera_estimator = CameraEstimator(args.estimator)
         self.camera_adjuster = CameraAdjuster(
-            args.adjuster, args.refinement_mask, args.confidence_threshold
+            args.adjuster,
+            args.refinement_mask,
+            args.confidence_threshold,
+            args.adjuster_cluster_size,
+            args.adjuster_max_iterations,
+            args.adjuster_epsilon,
+            args.adjuster_time_budget,
+            args.nr_workers,
         )
         self.wave_corrector = WaveCorrector(args.wave_correct_kind)
-        self.warper = Warper(args.warper_type)
+        self.warper = Warper(args.warper_type, args.nr_workers)
         self.cropper = Cropper(args.crop)
         self.compensator = ExposureErrorCompensator(
-            args.compensator, args.nr_feeds, args.block_size
+            args.compensator,
+            args.nr_feeds,
+            args.block_size,
+            args.compensator_update_interval,
+            args.gain_smoothing,
+            args.brightness_drift,
+            args.nr_workers,
         )
-        self.seam_finder = SeamFinder(args.finder)
-        self.blender = Blender(args.blender_type, args.blend_strength)
+        self.seam_finder = SeamFinder(args.finder, args.overlap_bands, args.nr_workers)
+        if args.blend_tile_size is None:
+            self.blender = Blender(args.blender_type, args.blend_strength)
+        else:
+            self.blender = TiledBlender(
+                args.blender_type,
+                args.blend_strength,
+                args.blend_tile_size,
+                args.blend_tmp_dir,
+                args.blend_in_memory,
+                args.nr_workers,
+            )
         self.timelapser = Timelapser(args.timelapse, args.timelapse_prefix)
 
-    def stitch_verbose(self, images, feature_masks=[], verbose_dir=None):
-        return verbose_stitching(self, images, feature_masks, verbose_dir)
+    def stitch_verbose(self, images, feature_masks=[], verbose_dir=None, cameras=None):
+        return verbose_stitching(self, images, feature_masks, verbose_dir, cameras)
 
-    def stitch(self, images, feature_masks=[]):
+    def stitch(self, images, feature_masks=[], cameras=None):
+        """cameras: optional list of cv.detail.CameraParams (see CameraLoader)
+        in the resolution of the input images. If given, the feature based
+        registration is skipped (see also the refine_given_cameras setting)"""
         self.images = Images.of(
-            images, self.medium_megapix, self.low_megapix, self.final_megapix
+            images,
+            self.medium_megapix,
+            self.low_megapix,
+            self.final_megapix,
+            self.seam_megapix,
         )
 
         imgs = self.resize_medium_resolution()
-        features = self.find_features(imgs, feature_masks)
-        matches = self.match_features(features)
-        imgs, features, matches = self.subset(imgs, features, matches)
-        cameras = self.estimate_camera_parameters(features, matches)
-        cameras = self.refine_camera_parameters(features, matches, cameras)
+        if cameras is None:
+            features = self.find_features(imgs, feature_masks)
+            matches = self.match_features(features)
+            imgs, features, matches = self.subset(imgs, features, matches)
+            cameras = self.estimate_camera_parameters(features, matches)
+            cameras = self.refine_camera_parameters(features, matches, cameras)
+        else:
+            cameras = self.scale_given_camera_parameters(cameras)
+            if self.refine_given_cameras:
+                features = self.find_features(imgs, feature_masks)
+                matches = self.match_features(features)
+                cameras = self.refine_camera_parameters(features, matches, cameras)
         cameras = self.perform_wave_correction(cameras)
         self.estimate_scale(cameras)
 
+        seam_imgs = self.resize_seam_resolution(imgs)
         imgs = self.resize_low_resolution(imgs)
         imgs, masks, corners, sizes = self.warp_low_resolution(imgs, cameras)
         self.prepare_cropper(imgs, masks, corners, sizes)
@@ -112,13 +174,14 @@ class Stitcher:
             imgs, masks, corners, sizes
         )
         self.estimate_exposure_errors(corners, imgs, masks)
+        if seam_imgs is not None:
+            imgs, masks, corners, sizes = self.warp_and_crop_seam_resolution(
+                seam_imgs, cameras
+            )
         seam_masks = self.find_seam_masks(imgs, corners, masks)
 
         imgs = self.resize_final_resolution()
-        imgs, masks, corners, sizes = self.warp_final_resolution(imgs, cameras)
-        imgs, masks, corners, sizes = self.crop_final_resolution(
-            imgs, masks, corners, sizes
-        )
+        imgs, masks, corners, sizes = self.warp_and_crop_final_resolution(imgs, cameras)
         self.set_masks(masks)
         imgs = self.compensate_exposure_errors(corners, imgs)
         seam_masks = self.resize_seam_masks(seam_masks)
@@ -155,9 +218,22 @@ class Stitcher:
     def estimate_camera_parameters(self, features, matches):
         return self.camera_estimator.estimate(features, matches)
 
+    def scale_given_camera_parameters(self, cameras):
+        CameraLoader.check_number_of_cameras(cameras, len(self.images.names))
+        return CameraLoader.rescale(
+            cameras,
+            self.images.get_scale(Images.Resolution.MEDIUM),
+            affine=self.warper.warper_type == "affine",
+        )
+
     def refine_camera_parameters(self, features, matches, cameras):
         return self.camera_adjuster.adjust(features, matches, cameras)
 
+    @property
+    def adjustment_report(self):
+        """AdjustmentReport of the last camera adjustment"""
+        return self.camera_adjuster.report
+
     def perform_wave_correction(self, cameras):
         return self.wave_corrector.correct(cameras)
 
@@ -167,6 +243,12 @@ class Stitcher:
     def resize_low_resolution(self, imgs=None):
         return list(self.images.resize(Images.Resolution.LOW, imgs))
 
+    def resize_seam_resolution(self, imgs=None):
+        """None if the seams are found in the low resolution images"""
+        if self.images.get_ratio(Images.Resolution.LOW, Images.Resolution.SEAM) == 1:
+            return None
+        return list(self.images.resize(Images.Resolution.SEAM, imgs))
+
     def warp_low_resolution(self, imgs, cameras):
         sizes = self.images.get_scaled_img_sizes(Images.Resolution.LOW)
         camera_aspect = self.images.get_ratio(
@@ -182,9 +264,33 @@ class Stitcher:
         )
         return self.warp(imgs, cameras, sizes, camera_aspect)
 
-    def warp(self, imgs, cameras, sizes, aspect=1):
-        imgs = self.warper.warp_images(imgs, cameras, aspect)
-        masks = self.warper.create_and_warp_masks(sizes, cameras, aspect)
+    def warp_and_crop_seam_resolution(self, imgs, cameras):
+        imgs, masks, corners, sizes = self.warp_and_crop(
+            imgs, cameras, Images.Resolution.SEAM
+        )
+        return list(imgs), list(masks), corners, sizes
+
+    def warp_and_crop_final_resolution(self, imgs, cameras):
+        """Equal to warp_final_resolution followed by crop_final_resolution,
+        but only the pixels within the crop rectangles are warped"""
+        return self.warp_and_crop(imgs, cameras, Images.Resolution.FINAL)
+
+    def warp_and_crop(self, imgs, cameras, resolution):
+        sizes = self.images.get_scaled_img_sizes(resolution)
+        camera_aspect = self.images.get_ratio(Images.Resolution.MEDIUM, resolution)
+        lir_aspect = self.images.get_ratio(Images.Resolution.LOW, resolution)
+        rectangles = self.cropper.get_crop_rectangles(lir_aspect)
+        imgs, masks, corners, sizes = self.warp(
+            imgs, cameras, sizes, camera_aspect, rectangles
+        )
+        corners, sizes = self.cropper.crop_rois(corners, sizes, lir_aspect)
+        return imgs, masks, corners, sizes
+
+    def warp(self, imgs, cameras, sizes, aspect=1, rectangles=None):
+        imgs_and_masks = self.warper.warp_images_and_masks(
+            imgs, cameras, aspect, rectangles
+        )
+        imgs, masks = Stitcher.unzip(imgs_and_masks)
         corners, sizes = self.warper.warp_rois(sizes, cameras, aspect)
         return imgs, masks, corners, sizes
 
@@ -217,8 +323,7 @@ class Stitcher:
         return self.images.resize(Images.Resolution.FINAL)
 
     def compensate_exposure_errors(self, corners, imgs):
-        for idx, (corner, img) in enumerate(zip(corners, imgs)):
-            yield self.compensator.apply(idx, corner, img, self.get_mask(idx))
+        return self.compensator.apply_to_images(corners, imgs)
 
     def resize_seam_masks(self, seam_masks):
         for idx, seam_mask in enumerate(seam_masks):
@@ -258,6 +363,13 @@ class Stitcher:
             panorama, _ = self.blender.blend()
             return panorama
 
+    @staticmethod
+    def unzip(pairs):
+        """Splits a generator of pairs into two generators. Consumed in
+        lockstep (as in stitch) only one pair is buffered"""
+        first, second = tee(pairs)
+        return (a for a, _ in first), (b for _, b in second)
+
     def validate_kwargs(self, kwargs):
         for arg in kwargs:
             if arg not in self.DEFAULT_SETTINGS:
@@ -285,3 +397,20 @@ class AffineStitcher(Stitcher):
                     StitchingWarning,
                 )
         super().initialize_stitcher(**kwargs)
+
+
+class TranslationStitcher(AffineStitcher):
+    """For scans and mosaics (e.g. flatbed or microscope stage scans) whose
+    images are only shifted against each other"""
+
+    AFFINE_DEFAULTS = AffineStitcher.AFFINE_DEFAULTS.copy()
+    AFFINE_DEFAULTS.update(
+        {
+            "matcher_type": "translation",
+            "estimator": "translation",
+            "adjuster": "translation",
+        }
+    )
+
+    DEFAULT_SETTINGS = Stitcher.DEFAULT_SETTINGS.copy()
+    DEFAULT_SETTINGS.update(AFFINE_DEFAULTS)
@@ -0,0 +1,155 @@
+import os
+import tempfile
+import weakref
+from itertools import repeat
+
+import cv2 as cv
+import numpy as np
+
+from .blender import Blender
+from .cropper import Rectangle, RoiIndex, crop, get_intersection, grow
+from .parallel import parallel_map
+
+
+class TiledBlender(Blender):
+    """Blends the panorama tile by tile, so that the memory is bounded by the
+    tile size instead of the panorama size. The fed images and masks are
+    written to a temporary directory. Each tile is blended (with a margin
+    covering the blending transitions) from the parts of the images
+    intersecting it and written to a memory mapped panorama file.
+
+    The returned panorama and mask are memory mapped arrays whose files (in
+    tmp_dir) are removed when the arrays and all views of them are garbage
+    collected. Copy or save the panorama to keep it.
+
+    With in_memory the images and the panorama are kept in memory, e.g. to
+    blend the tiles of a panorama which fits in RAM in nr_workers threads"""
+
+    DEFAULT_TILE_SIZE = 4096
+    DEFAULT_NR_WORKERS = 1
+
+    def __init__(
+        self,
+        blender_type=Blender.DEFAULT_BLENDER,
+        blend_strength=Blender.DEFAULT_BLEND_STRENGTH,
+        tile_size=DEFAULT_TILE_SIZE,
+        tmp_dir=None,
+        in_memory=False,
+        nr_workers=DEFAULT_NR_WORKERS,
+    ):
+        super().__init__(blender_type, blend_strength)
+        self.tile_size = tile_size
+        self.tmp_dir = tmp_dir
+        self.in_memory = in_memory
+        self.nr_workers = nr_workers
+        self.tmp = None
+        self.panorama_roi = None
+        self.rectangles = []
+        self.fed = []
+
+    def prepare(self, corners, sizes):
+        self.panorama_roi = Rectangle(
+            *cv.detail.resultRoi(corners=corners, sizes=sizes)
+        )
+        self.blend_width = self.get_blend_width(self.panorama_roi)
+        if not self.in_memory:
+            self.tmp = tempfile.TemporaryDirectory(dir=self.tmp_dir)
+        self.rectangles = []
+        self.fed = []
+
+    def feed(self, img, mask, corner):
+        idx = len(self.rectangles)
+        if isinstance(mask, cv.UMat):
+            mask = cv.UMat.get(mask)
+        if self.in_memory:
+            self.fed.append((img, mask))
+        else:
+            np.save(self.get_filename("img", idx), img)
+            np.save(self.get_filename("mask", idx), mask)
+        self.rectangles.append(Rectangle(*corner, img.shape[1], img.shape[0]))
+
+    def blend(self):
+        panorama, panorama_mask = self.create_panorama()
+        roi_index = RoiIndex(self.rectangles)
+        tiles = list(self.get_tiles())
+        results = parallel_map(
+            self.blend_tile, tiles, repeat(roi_index), nr_workers=self.nr_workers
+        )
+        for tile, result in zip(tiles, results):
+            if result is None:
+                continue
+            result, result_mask = result
+            crop(panorama, tile, self.panorama_roi.corner)[:] = result
+            crop(panorama_mask, tile, self.panorama_roi.corner)[:] = result_mask
+        if self.in_memory:
+            self.fed = []
+            return panorama, panorama_mask
+        panorama.flush()
+        panorama_mask.flush()
+        self.tmp.cleanup()
+        self.tmp = None
+        return panorama, panorama_mask
+
+    def create_panorama(self):
+        width, height = self.panorama_roi.size
+        if self.in_memory:
+            return (
+                np.zeros((height, width, 3), np.uint8),
+                np.zeros((height, width), np.uint8),
+            )
+        return (
+            self.create_memmap((height, width, 3)),
+            self.create_memmap((height, width)),
+        )
+
+    def create_memmap(self, shape):
+        """A memory mapped array in a file of tmp_dir, which is removed with
+        the memory map (when the array and its views are garbage collected).
+        The file doesn't belong to the temporary directory of the fed images,
+        which is removed by the next prepare"""
+        fd, filename = tempfile.mkstemp(suffix=".npy", dir=self.tmp_dir)
+        os.close(fd)
+        array = np.lib.format.open_memmap(filename, "w+", np.uint8, shape)
+        weakref.finalize(array.base, os.remove, filename)
+        return array
+
+    def blend_tile(self, tile, roi_index):
+        margin = int(np.ceil(self.blend_width))
+        blend_roi = get_intersection(grow(tile, margin), self.panorama_roi)
+        blend_roi = self.align_to_pyramid(blend_roi, self.panorama_roi.corner)
+        indices = roi_index.intersecting(blend_roi)
+        if len(indices) == 0:
+            return None
+
+        blender = Blender(self.blender_type, self.blend_strength)
+        blender.prepare_roi(blend_roi, self.blend_width)
+        for idx in indices:
+            rectangle = self.rectangles[idx]
+            overlap = get_intersection(rectangle, blend_roi)
+            img, mask = self.load(idx)
+            blender.feed(
+                crop(img, overlap, rectangle.corner),
+                np.ascontiguousarray(crop(mask, overlap, rectangle.corner)),
+                overlap.corner,
+            )
+        tile_in_blend_roi = Rectangle(
+            tile.x - blend_roi.x, tile.y - blend_roi.y, *tile.size
+        )
+        return blender.blend(tile_in_blend_roi)
+
+    def get_tiles(self):
+        roi = self.panorama_roi
+        for y in range(roi.y, roi.y2, self.tile_size):
+            for x in range(roi.x, roi.x2, self.tile_size):
+                tile = Rectangle(x, y, self.tile_size, self.tile_size)
+                yield get_intersection(tile, roi)
+
+    def load(self, idx):
+        if self.in_memory:
+            return self.fed[idx]
+        img = np.load(self.get_filename("img", idx), mmap_mode="r")
+        mask = np.load(self.get_filename("mask", idx), mmap_mode="r")
+        return img, mask
+
+    def get_filename(self, name, idx):
+        return os.path.join(self.tmp.name, f"{name}{idx}.npy")
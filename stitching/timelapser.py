@@ -3,6 +3,8 @@ import os
 import cv2 as cv
 import numpy as np
 
+from .blender import Int16Buffer
+
 
 class Timelapser:
     """https://docs.opencv.org/4.x/dd/dac/classcv_1_1detail_1_1Timelapser.html"""
@@ -22,6 +24,7 @@ class Timelapser:
         self.timelapse_type = None
         self.timelapser = None
         self.timelapse_prefix = timelapse_prefix
+        self.buffer = Int16Buffer()
 
         if timelapse == "as_is":
             self.timelapse_type = cv.detail.Timelapser_AS_IS
@@ -42,14 +45,11 @@ class Timelapser:
 
     def process_frame(self, img, corner):
         mask = np.ones((img.shape[0], img.shape[1]), np.uint8)
-        img = img.astype(np.int16)
-        self.timelapser.process(img, mask, corner)
+        self.timelapser.process(self.buffer.widen(img), mask, corner)
 
     def get_frame(self):
         frame = self.timelapser.getDst()
-        frame = np.float32(cv.UMat.get(frame))
-        frame = cv.convertScaleAbs(frame)
-        return frame
+        return cv.convertScaleAbs(frame).get()
 
     def get_fixed_filename(self, img_name):
         dirname, filename = os.path.split(img_name)
@@ -2,76 +2,58 @@ import os
 
 import cv2 as cv
 
+from .camera_loader import CameraLoader
 from .images import Images
 from .seam_finder import SeamFinder
 from .timelapser import Timelapser
 
 
-def verbose_stitching(stitcher, images, feature_masks=[], verbose_dir=None):
+def verbose_stitching(
+    stitcher, images, feature_masks=[], verbose_dir=None, cameras=None
+):
     _dir = "." if verbose_dir is None else verbose_dir
 
     with open(verbose_output(_dir, "00_stitcher.txt"), "w") as file:
         file.write(type(stitcher).__name__ + "(**" + str(stitcher.kwargs) + ")")
 
     images = Images.of(
-        images, stitcher.medium_megapix, stitcher.low_megapix, stitcher.final_megapix
+        images,
+        stitcher.medium_megapix,
+        stitcher.low_megapix,
+        stitcher.final_megapix,
+        stitcher.seam_megapix,
     )
 
     # Resize Images
     imgs = list(images.resize(Images.Resolution.MEDIUM))
 
-    # Find Features
-    finder = stitcher.detector
-    features = stitcher.find_features(imgs, feature_masks)
-    for idx, img_features in enumerate(features):
-        img_with_features = finder.draw_keypoints(imgs[idx], img_features)
-        write_verbose_result(_dir, f"01_features_img{idx + 1}.jpg", img_with_features)
-
-    # Match Features
-    matcher = stitcher.matcher
-    matches = matcher.match_features(features)
-
-    # Subset
-    subsetter = stitcher.subsetter
-
-    all_relevant_matches = list(
-        matcher.draw_matches_matrix(
-            imgs,
-            features,
-            matches,
-            conf_thresh=subsetter.confidence_threshold,
-            inliers=True,
-            matchColor=(0, 255, 0),
+    if cameras is None:
+        imgs, cameras = verbose_registration(
+            stitcher, images, imgs, feature_masks, _dir
         )
-    )
-    for idx1, idx2, img in all_relevant_matches:
-        write_verbose_result(
-            _dir, f"02_matches_img{idx1 + 1}_to_img{idx2 + 1}.jpg", img
+    else:
+        # Given Cameras (and optional Adjustion)
+        CameraLoader.check_number_of_cameras(cameras, len(images.names))
+        cameras = CameraLoader.rescale(
+            cameras,
+            images.get_scale(Images.Resolution.MEDIUM),
+            affine=stitcher.warper.warper_type == "affine",
         )
+        if stitcher.refine_given_cameras:
+            features = stitcher.find_features(imgs, feature_masks)
+            matches = stitcher.matcher.match_features(features)
+            cameras = stitcher.camera_adjuster.adjust(features, matches, cameras)
+            write_adjustment_report(stitcher.camera_adjuster, _dir)
 
-    # Subset
-    subsetter = stitcher.subsetter
-    subsetter.save_file = verbose_output(_dir, "03_matches_graph.txt")
-    subsetter.save_matches_graph_dot_file(images.names, matches)
-
-    indices = subsetter.get_indices_to_keep(features, matches)
-
-    imgs = subsetter.subset_list(imgs, indices)
-    features = subsetter.subset_list(features, indices)
-    matches = subsetter.subset_matches(matches, indices)
-    images.subset(indices)
-
-    # Camera Estimation, Adjustion and Correction
-    camera_estimator = stitcher.camera_estimator
-    camera_adjuster = stitcher.camera_adjuster
+    # Camera Correction
     wave_corrector = stitcher.wave_corrector
-
-    cameras = camera_estimator.estimate(features, matches)
-    cameras = camera_adjuster.adjust(features, matches, cameras)
     cameras = wave_corrector.correct(cameras)
 
     # Warp Images
     low_imgs = list(images.resize(Images.Resolution.LOW, imgs))
+    seam_imgs = None
+    if images.get_ratio(Images.Resolution.LOW, Images.Resolution.SEAM) != 1:
+        seam_imgs = list(images.resize(Images.Resolution.SEAM, imgs))
     imgs = None  # free memory
 
     warper = stitcher.warper
@@ -80,17 +62,17 @@ def verbose_stitching(stitcher, images, feature_masks=[], verbose_dir=None):
     low_sizes = images.get_scaled_img_sizes(Images.Resolution.LOW)
     camera_aspect = images.get_ratio(Images.Resolution.MEDIUM, Images.Resolution.LOW)
 
-    low_imgs = list(warper.warp_images(low_imgs, cameras, camera_aspect))
-    low_masks = list(warper.create_and_warp_masks(low_sizes, cameras, camera_aspect))
+    low_imgs, low_masks = map(
+        list, zip(*warper.warp_images_and_masks(low_imgs, cameras, camera_aspect))
+    )
     low_corners, low_sizes = warper.warp_rois(low_sizes, cameras, camera_aspect)
 
     final_sizes = images.get_scaled_img_sizes(Images.Resolution.FINAL)
     camera_aspect = images.get_ratio(Images.Resolution.MEDIUM, Images.Resolution.FINAL)
 
     final_imgs = list(images.resize(Images.Resolution.FINAL))
-    final_imgs = list(warper.warp_images(final_imgs, cameras, camera_aspect))
-    final_masks = list(
-        warper.create_and_warp_masks(final_sizes, cameras, camera_aspect)
+    final_imgs, final_masks = map(
+        list, zip(*warper.warp_images_and_masks(final_imgs, cameras, camera_aspect))
     )
     final_corners, final_sizes = warper.warp_rois(final_sizes, cameras, camera_aspect)
 
@@ -110,9 +92,7 @@ def verbose_stitching(stitcher, images, feature_masks=[], verbose_dir=None):
     cropper = stitcher.cropper
 
     if cropper.do_crop:
-        mask = cropper.estimate_panorama_mask(
-            low_imgs, low_masks, low_corners, low_sizes
-        )
+        mask = cropper.create_panorama_mask(low_masks, low_corners, low_sizes)
         write_verbose_result(_dir, "06_estimated_mask_to_crop.jpg", mask)
 
         lir = cropper.estimate_largest_interior_rectangle(mask)
@@ -145,7 +125,29 @@ def verbose_stitching(stitcher, images, feature_masks=[], verbose_dir=None):
     # Seam Masks
     seam_finder = stitcher.seam_finder
 
-    seam_masks = seam_finder.find(low_imgs, low_corners, low_masks)
+    if seam_imgs is None:
+        seam_imgs, seam_img_masks, seam_corners = low_imgs, low_masks, low_corners
+    else:
+        seam_sizes = images.get_scaled_img_sizes(Images.Resolution.SEAM)
+        camera_aspect = images.get_ratio(
+            Images.Resolution.MEDIUM, Images.Resolution.SEAM
+        )
+        lir_aspect = images.get_ratio(Images.Resolution.LOW, Images.Resolution.SEAM)
+        seam_imgs, seam_img_masks = map(
+            list,
+            zip(
+                *warper.warp_images_and_masks(
+                    seam_imgs,
+                    cameras,
+                    camera_aspect,
+                    cropper.get_crop_rectangles(lir_aspect),
+                )
+            ),
+        )
+        seam_corners, seam_sizes = warper.warp_rois(seam_sizes, cameras, camera_aspect)
+        seam_corners, _ = cropper.crop_rois(seam_corners, seam_sizes, lir_aspect)
+
+    seam_masks = seam_finder.find(seam_imgs, seam_corners, seam_img_masks)
     seam_masks = [
         seam_finder.resize(seam_mask, mask)
         for seam_mask, mask in zip(seam_masks, final_masks)
@@ -196,6 +198,64 @@ def verbose_stitching(stitcher, images, feature_masks=[], verbose_dir=None):
     return panorama
 
 
+def verbose_registration(stitcher, images, imgs, feature_masks, _dir):
+    # Find Features
+    finder = stitcher.detector
+    features = stitcher.find_features(imgs, feature_masks)
+    for idx, img_features in enumerate(features):
+        img_with_features = finder.draw_keypoints(imgs[idx], img_features)
+        write_verbose_result(_dir, f"01_features_img{idx + 1}.jpg", img_with_features)
+
+    # Match Features
+    matcher = stitcher.matcher
+    matches = matcher.match_features(features)
+
+    # Subset
+    subsetter = stitcher.subsetter
+
+    all_relevant_matches = list(
+        matcher.draw_matches_matrix(
+            imgs,
+            features,
+            matches,
+            conf_thresh=subsetter.confidence_threshold,
+            inliers=True,
+            matchColor=(0, 255, 0),
+        )
+    )
+    for idx1, idx2, img in all_relevant_matches:
+        write_verbose_result(
+            _dir, f"02_matches_img{idx1 + 1}_to_img{idx2 + 1}.jpg", img
+        )
+
+    # Subset
+    subsetter = stitcher.subsetter
+    subsetter.save_file = verbose_output(_dir, "03_matches_graph.txt")
+    subsetter.save_matches_graph_dot_file(images.names, matches)
+
+    indices = subsetter.get_indices_to_keep(features, matches)
+
+    imgs = subsetter.subset_list(imgs, indices)
+    features = subsetter.subset_list(features, indices)
+    matches = subsetter.subset_matches(matches, indices)
+    images.subset(indices)
+
+    # Camera Estimation and Adjustion
+    camera_estimator = stitcher.camera_estimator
+    camera_adjuster = stitcher.camera_adjuster
+
+    cameras = camera_estimator.estimate(features, matches)
+    cameras = camera_adjuster.adjust(features, matches, cameras)
+    write_adjustment_report(camera_adjuster, _dir)
+
+    return imgs, cameras
+
+
+def write_adjustment_report(camera_adjuster, _dir):
+    with open(verbose_output(_dir, "03_camera_adjustment.txt"), "w") as file:
+        file.write(str(camera_adjuster.report))
+
+
 def write_verbose_result(dir_name, img_name, img):
     cv.imwrite(verbose_output(dir_name, img_name), img)
 
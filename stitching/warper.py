@@ -1,8 +1,13 @@
+import threading
+from itertools import repeat
 from statistics import median
 
 import cv2 as cv
 import numpy as np
 
+from .cropper import Rectangle, crop, get_intersection
+from .parallel import parallel_map
+
 
 class Warper:
     """https://docs.opencv.org/4.x/da/db8/classcv_1_1detail_1_1RotationWarper.html"""
@@ -27,22 +32,113 @@ class Warper:
     )
 
     DEFAULT_WARP_TYPE = "spherical"
+    DEFAULT_NR_WORKERS = 1
+    # distance of the sampled border points of map rectangles
+    MAP_STEP = 8
 
-    def __init__(self, warper_type=DEFAULT_WARP_TYPE):
+    def __init__(self, warper_type=DEFAULT_WARP_TYPE, nr_workers=DEFAULT_NR_WORKERS):
         self.warper_type = warper_type
+        self.nr_workers = nr_workers
         self.scale = None
+        self.local = threading.local()
 
     def set_scale(self, cameras):
         focals = [cam.focal for cam in cameras]
         self.scale = median(focals)
+        self.local = threading.local()
+
+    def get_warper(self, aspect=1):
+        """The opencv warper of the scaled warp scale, created once per scale
+        and thread (opencv warpers keep state while warping). The warpers of
+        a thread are released with the thread"""
+        warpers = self.local.__dict__.setdefault("warpers", {})
+        scale = self.scale * aspect
+        if scale not in warpers:
+            warpers[scale] = cv.PyRotationWarper(self.warper_type, scale)
+        return warpers[scale]
+
+    def warp_images_and_masks(self, imgs, cameras, aspect=1, rectangles=None):
+        if rectangles is None:
+            rectangles = [None] * len(cameras)
+        return parallel_map(
+            self.warp_image_and_mask,
+            imgs,
+            cameras,
+            repeat(aspect),
+            rectangles,
+            nr_workers=self.nr_workers,
+        )
+
+    def warp_image_and_mask(self, img, camera, aspect=1, rectangle=None):
+        """Projects the image and its mask using the same maps, which is
+        equal to warp_image and create_and_warp_mask but builds the maps once.
+        If a rectangle (x, y, width, height) within the warped image is given,
+        only the maps and pixels within the rectangle are built and remapped"""
+        size = (img.shape[1], img.shape[0])
+        K = Warper.get_K(camera, aspect)
+        if rectangle is None:
+            _, xmap, ymap = self.get_warper(aspect).buildMaps(size, K, camera.R)
+        else:
+            xmap, ymap = self.build_maps_within(size, K, camera.R, rectangle, aspect)
+        warped_image = cv.remap(
+            img, xmap, ymap, cv.INTER_LINEAR, borderMode=cv.BORDER_REFLECT
+        )
+        return warped_image, Warper.get_mask(size, xmap, ymap)
+
+    def build_maps_within(self, size, K, R, rectangle, aspect=1):
+        """The maps of the rectangle (x, y, width, height) within the warped
+        image, clipped to the warped image like a slice of its maps. opencv
+        computes the maps of a warped pixel from its position only, but builds
+        them for the whole region an image is warped to. So they are built for
+        the top left part of the image which covers the rectangle projected
+        back, if this part is warped to a smaller region. The maps are equal
+        to the sliced maps of the whole image"""
+        warper = self.get_warper(aspect)
+        roi = Rectangle(*warper.warpRoi(size, K, R))
+        x, y, width, height = rectangle
+        target = get_intersection(Rectangle(x + roi.x, y + roi.y, width, height), roi)
+        part = self.get_source_part(K, R, target, aspect)
+        if part is not None and part.x2 > 0 and part.y2 > 0:
+            part_size = (min(part.x2, size[0]), min(part.y2, size[1]))
+            part_roi = Rectangle(*warper.warpRoi(part_size, K, R))
+            within_part = get_intersection(target, part_roi) == target
+            if within_part and part_roi.area < roi.area:
+                _, xmap, ymap = warper.buildMaps(part_size, K, R)
+                return crop(xmap, target, part_roi.corner), crop(
+                    ymap, target, part_roi.corner
+                )
+
+        # the rectangle is projected back (nearly) beyond the image
+        _, xmap, ymap = warper.buildMaps(size, K, R)
+        return crop(xmap, target, roi.corner), crop(ymap, target, roi.corner)
+
+    def get_source_part(self, K, R, rectangle, aspect=1):
+        """Bounding box (with a margin) of the rectangle of the warped image
+        projected back into the image, None if it is projected to infinity"""
+        warper = self.get_warper(aspect)
+        points = np.array(
+            [
+                warper.warpPointBackward(point, K, R)
+                for point in get_border_points(rectangle, self.MAP_STEP)
+            ]
+        )
+        if not np.all(np.isfinite(points)):
+            return None
+        x1, y1 = np.floor(points.min(axis=0)).astype(int) - self.MAP_STEP
+        x2, y2 = np.ceil(points.max(axis=0)).astype(int) + self.MAP_STEP
+        return Rectangle(int(x1), int(y1), int(x2 - x1), int(y2 - y1))
 
     def warp_images(self, imgs, cameras, aspect=1):
-        for img, camera in zip(imgs, cameras):
-            yield self.warp_image(img, camera, aspect)
+        return parallel_map(
+            self.warp_image,
+            imgs,
+            cameras,
+            repeat(aspect),
+            nr_workers=self.nr_workers,
+        )
 
     def warp_image(self, img, camera, aspect=1):
-        warper = cv.PyRotationWarper(self.warper_type, self.scale * aspect)
-        _, warped_image = warper.warp(
+        _, warped_image = self.get_warper(aspect).warp(
             img,
             Warper.get_K(camera, aspect),
             camera.R,
@@ -52,20 +148,27 @@ class Warper:
         return warped_image
 
     def create_and_warp_masks(self, sizes, cameras, aspect=1):
-        for size, camera in zip(sizes, cameras):
-            yield self.create_and_warp_mask(size, camera, aspect)
+        return parallel_map(
+            self.create_and_warp_mask,
+            sizes,
+            cameras,
+            repeat(aspect),
+            nr_workers=self.nr_workers,
+        )
 
     def create_and_warp_mask(self, size, camera, aspect=1):
-        warper = cv.PyRotationWarper(self.warper_type, self.scale * aspect)
-        mask = 255 * np.ones((size[1], size[0]), np.uint8)
-        _, warped_mask = warper.warp(
-            mask,
-            Warper.get_K(camera, aspect),
-            camera.R,
-            cv.INTER_NEAREST,
-            cv.BORDER_CONSTANT,
+        _, xmap, ymap = self.get_warper(aspect).buildMaps(
+            size, Warper.get_K(camera, aspect), camera.R
         )
-        return warped_mask
+        return Warper.get_mask(size, xmap, ymap)
+
+    @staticmethod
+    def get_mask(size, xmap, ymap):
+        """The pixels mapped into an image of the given size. Equal to
+        remapping a white image with nearest neighbour interpolation, which
+        rounds the maps the same way as convertMaps"""
+        map1, _ = cv.convertMaps(xmap, ymap, cv.CV_16SC2, nninterpolation=True)
+        return cv.inRange(map1, (0, 0), (size[0] - 1, size[1] - 1))
 
     def warp_rois(self, sizes, cameras, aspect=1):
         roi_corners = []
@@ -77,9 +180,8 @@ class Warper:
         return roi_corners, roi_sizes
 
     def warp_roi(self, size, camera, aspect=1):
-        warper = cv.PyRotationWarper(self.warper_type, self.scale * aspect)
         K = Warper.get_K(camera, aspect)
-        return warper.warpRoi(size, K, camera.R)
+        return self.get_warper(aspect).warpRoi(size, K, camera.R)
 
     @staticmethod
     def get_K(camera, aspect=1):
@@ -92,3 +194,11 @@ class Warper:
         K[1, 1] *= aspect
         K[1, 2] *= aspect
         return K
+
+
+def get_border_points(rectangle, step):
+    xs = list(range(rectangle.x, rectangle.x2, step)) + [rectangle.x2]
+    ys = list(range(rectangle.y, rectangle.y2, step)) + [rectangle.y2]
+    points = [(x, y) for x in xs for y in (rectangle.y, rectangle.y2)]
+    points += [(x, y) for y in ys for x in (rectangle.x, rectangle.x2)]
+    return points
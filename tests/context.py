@@ -5,13 +5,24 @@ import cv2 as cv
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from stitching import AffineStitcher, Stitcher  # noqa: F401, E402
-from stitching.blender import Blender  # noqa: F401, E402
+from stitching import (  # noqa: F401, E402
+    AffineStitcher,
+    IncrementalStitcher,
+    Stitcher,
+    TranslationStitcher,
+)
+from stitching.blender import Blender, Int16Buffer  # noqa: F401, E402
 from stitching.camera_adjuster import CameraAdjuster  # noqa: F401, E402
 from stitching.camera_estimator import CameraEstimator  # noqa: F401, E402
+from stitching.camera_loader import CameraLoader  # noqa: F401, E402
 from stitching.camera_wave_corrector import WaveCorrector  # noqa: F401, E402
 from stitching.cli.stitch import create_parser, main  # noqa: F401, E402
-from stitching.cropper import Cropper  # noqa: F401, E402
+from stitching.cropper import (  # noqa: F401, E402
+    Cropper,
+    Rectangle,
+    RoiIndex,
+    get_intersection,
+)
 from stitching.exposure_error_compensator import (  # noqa: F401, E402
     ExposureErrorCompensator,
 )
@@ -22,12 +33,17 @@ from stitching.megapix_scaler import (  # noqa: F401, E402
     MegapixDownscaler,
     MegapixScaler,
 )
-from stitching.seam_finder import SeamFinder  # noqa: F401, E402
+from stitching.parallel import parallel_map  # noqa: F401, E402
+from stitching.seam_finder import (  # noqa: F401, E402
+    SeamFinder,
+    remove_invalid_line_pixels,
+)
 from stitching.stitching_error import (  # noqa: F401, E402
     StitchingError,
     StitchingWarning,
 )
 from stitching.subsetter import Subsetter  # noqa: F401, E402
+from stitching.tiled_blender import TiledBlender  # noqa: F401, E402
 from stitching.timelapser import Timelapser  # noqa: F401, E402
 from stitching.warper import Warper  # noqa: F401, E402
 
@@ -0,0 +1,98 @@
+import unittest
+
+import cv2 as cv
+import numpy as np
+
+from .context import Blender, Int16Buffer, Rectangle
+
+
+def create_images():
+    rng = np.random.default_rng(0)
+    imgs, masks = [], []
+    for _ in range(3):
+        img = (rng.random((120, 160, 3)) * 255).astype(np.uint8)
+        imgs.append(cv.GaussianBlur(img, (9, 9), 0))
+        mask = np.zeros((120, 160), np.uint8)
+        cv.ellipse(mask, (70, 60), (50, 40), 0, 0, 360, 255, -1)
+        masks.append(mask)
+    corners = [(0, 0), (90, 10), (180, -5)]
+    sizes = [(160, 120)] * 3
+    return imgs, masks, corners, sizes
+
+
+def blend_with_opencv(blender, imgs, masks, corners):
+    """The blending of full int16 images, as the Blender fed them before"""
+    for img, mask, corner in zip(imgs, masks, corners):
+        blender.blender.feed(cv.UMat(img.astype(np.int16)), mask, corner)
+    result, result_mask = blender.blender.blend(None, None)
+    return cv.convertScaleAbs(result), result_mask
+
+
+class TestBlender(unittest.TestCase):
+    def test_blend(self):
+        imgs, masks, corners, sizes = create_images()
+        for blender_type in Blender.BLENDER_CHOICES:
+            blender = Blender(blender_type)
+            blender.prepare(corners, sizes)
+            expected, expected_mask = blend_with_opencv(blender, imgs, masks, corners)
+
+            blender.prepare(corners, sizes)
+            for img, mask, corner in zip(imgs, masks, corners):
+                blender.feed(img, cv.UMat(mask), corner)
+            panorama, panorama_mask = blender.blend()
+
+            np.testing.assert_array_equal(panorama, expected)
+            np.testing.assert_array_equal(panorama_mask, expected_mask)
+
+    def test_feed_strips_of_seam_masks(self):
+        imgs, masks, corners, sizes = create_images()
+        for mask in masks:
+            mask[:] = 0
+            mask[:, 60:100] = 255
+        for blender_type in Blender.BLENDER_CHOICES:
+            blender = Blender(blender_type, blend_strength=20)
+            blender.prepare(corners, sizes)
+            expected, _ = blend_with_opencv(blender, imgs, masks, corners)
+
+            blender.prepare(corners, sizes)
+            for img, mask, corner in zip(imgs, masks, corners):
+                blender.feed(img, mask, corner)
+            panorama, _ = blender.blend()
+
+            np.testing.assert_array_equal(panorama, expected)
+
+    def test_blend_roi(self):
+        imgs, masks, corners, sizes = create_images()
+        blender = Blender()
+        blender.prepare(corners, sizes)
+        for img, mask, corner in zip(imgs, masks, corners):
+            blender.feed(img, mask, corner)
+        expected, expected_mask = blender.blend()
+
+        blender.prepare(corners, sizes)
+        for img, mask, corner in zip(imgs, masks, corners):
+            blender.feed(img, mask, corner)
+        roi = Rectangle(30, 20, 100, 50)
+        panorama, panorama_mask = blender.blend(roi)
+
+        np.testing.assert_array_equal(panorama, expected[20:70, 30:130])
+        np.testing.assert_array_equal(panorama_mask, expected_mask[20:70, 30:130])
+
+    def test_int16_buffer(self):
+        buffer = Int16Buffer()
+        img = np.full((20, 30, 3), 200, np.uint8)
+        widened = buffer.widen(img)
+        self.assertEqual(widened.dtype, np.int16)
+        np.testing.assert_array_equal(widened, img)
+
+        smaller_widened = buffer.widen(img[:10])
+        self.assertTrue(np.shares_memory(widened, smaller_widened))
+        np.testing.assert_array_equal(smaller_widened, img[:10])
+
+
+def start_test():
+    unittest.main()
+
+
+if __name__ == "__main__":
+    start_test()
@@ -0,0 +1,188 @@
+import unittest
+from unittest.mock import patch
+
+import cv2 as cv
+import numpy as np
+
+from .context import CameraAdjuster, CameraLoader
+
+
+def create_matches(confidences):
+    matches = []
+    for confidence in np.array(confidences).flatten():
+        match = cv.detail.MatchesInfo()
+        match.confidence = confidence
+        matches.append(match)
+    return matches
+
+
+class TestCameraAdjuster(unittest.TestCase):
+    def test_get_clusters(self):
+        # chain 0 - 1 - 2 - 3 - 4 with the weakest match between 1 and 2
+        confidences = np.zeros((5, 5))
+        for i, j, confidence in ((0, 1, 3), (1, 2, 1.5), (2, 3, 3), (3, 4, 2)):
+            confidences[i, j] = confidences[j, i] = confidence
+        matches = create_matches(confidences)
+        adjuster = CameraAdjuster(cluster_size=2)
+
+        clusters = adjuster.get_clusters(matches)
+        extended_clusters = adjuster.extend_clusters(clusters, matches)
+
+        self.assertEqual(clusters, [[0, 1], [2, 3], [4]])
+        self.assertEqual(extended_clusters, [[0, 1, 2], [1, 2, 3, 4], [3, 4]])
+
+    def test_get_alignment(self):
+        rotations = [
+            cv.Rodrigues(np.array([0.1 * i, 0.2, -0.1 * i]))[0] for i in range(3)
+        ]
+        G = cv.Rodrigues(np.array([0.3, -0.2, 0.1]))[0]
+
+        alignment = CameraAdjuster().get_alignment(
+            [G @ R for R in rotations], rotations
+        )
+        np.testing.assert_allclose(alignment, G, atol=1e-6)
+
+        G = np.array([[1.1, 0.1, 20], [-0.1, 1.1, -5], [0, 0, 1]])
+        homographies = [
+            np.array([[1, 0, 10 * i], [0, 1, i], [0, 0, 1]]) for i in range(3)
+        ]
+        alignment = CameraAdjuster("affine").get_alignment(
+            [G @ H for H in homographies], homographies
+        )
+        np.testing.assert_allclose(alignment, G, atol=1e-6)
+
+    def test_refine_alignment(self):
+        # a ring of clusters (e.g. of a 360 degree panorama) sharing two noisy
+        # cameras with each neighbour, the chained alignment can't close it
+        rng = np.random.default_rng(0)
+        rotations = [
+            cv.Rodrigues(np.array([0, np.pi / 6 * i, 0]))[0] for i in range(12)
+        ]
+        cluster_cameras = []
+        for start in range(0, 12, 2):
+            G = cv.Rodrigues(rng.normal(0, 0.3, 3))[0]
+            cameras = {}
+            for idx in [(start + offset) % 12 for offset in range(4)]:
+                noise = cv.Rodrigues(rng.normal(0, 0.01, 3))[0]
+                cameras[idx] = CameraLoader.from_intrinsics_and_rotations(
+                    [np.eye(3)], [G @ noise @ rotations[idx]]
+                )[0]
+            cluster_cameras.append(cameras)
+
+        def disagreement():
+            return sum(
+                np.sum((cluster[idx].R - other[idx].R) ** 2)
+                for cluster in cluster_cameras
+                for other in cluster_cameras
+                for idx in cluster
+                if idx in other
+            )
+
+        adjuster = CameraAdjuster()
+        adjuster.align_clusters(cluster_cameras)
+        chained_disagreement = disagreement()
+        adjuster.refine_alignment(cluster_cameras)
+
+        self.assertLess(disagreement(), chained_disagreement)
+        for cluster in cluster_cameras[1:]:
+            shared = [
+                (other[idx].R, camera.R)
+                for idx, camera in cluster.items()
+                for other in cluster_cameras
+                if other is not cluster and idx in other
+            ]
+            alignment = adjuster.get_alignment(*zip(*shared))
+            np.testing.assert_allclose(alignment, np.eye(3), atol=1e-5)
+
+    def test_unify_focals(self):
+        rotations = [cv.Rodrigues(np.array([0, 0.01 * i, 0]))[0] for i in range(3)]
+        K = [[1000, 0, 50], [0, 1000, 50], [0, 0, 1]]
+        cluster = CameraLoader.from_intrinsics_and_rotations([K] * 3, rotations)
+        # the same images with a 25% larger focal and smaller angles
+        K = [[1250, 0, 50], [0, 1250, 50], [0, 0, 1]]
+        other = CameraLoader.from_intrinsics_and_rotations(
+            [K] * 3, [R.T @ R.T for R in rotations[:1]] + rotations[:2]
+        )
+        cluster_cameras = [dict(enumerate(cluster)), dict(enumerate(other, 1))]
+
+        CameraAdjuster().unify_focals(cluster_cameras)
+
+        for cameras in cluster_cameras:
+            for camera in cameras.values():
+                self.assertAlmostEqual(camera.focal, 1125)
+        angles = [cv.Rodrigues(camera.R)[0][1, 0] for camera in cluster]
+        np.testing.assert_allclose(angles, [0, 0.01 / 1.125, 0.02 / 1.125])
+
+    def test_reprojection_error(self):
+        points = ((0, 0), (10, 5), (20, 30))
+        features = [cv.detail.ImageFeatures() for _ in range(2)]
+        features[0].keypoints = [cv.KeyPoint(x, y, 1) for x, y in points]
+        features[1].keypoints = [cv.KeyPoint(x + 5, y - 2, 1) for x, y in points]
+        matches = create_matches([[0, 2], [2, 0]])
+        matches[1].matches = [cv.DMatch(i, i, 0) for i in range(3)]
+        matches[1].inliers_mask = np.ones(3, np.uint8)
+        cameras = CameraLoader.from_homographies(
+            [np.eye(3), [[1, 0, 5], [0, 1, -2], [0, 0, 1]]]
+        )
+        adjuster = CameraAdjuster("affine")
+
+        error = adjuster.get_error_function(features, matches)
+
+        self.assertAlmostEqual(error(cameras), 0)
+        cameras[1].R = np.eye(3, dtype=np.float32)
+        self.assertAlmostEqual(error(cameras), np.sqrt(29))
+
+    def test_affine_reprojection_error_of_rotated_cameras(self):
+        def rotation(degrees, tx, ty):
+            c, s = np.cos(np.deg2rad(degrees)), np.sin(np.deg2rad(degrees))
+            return np.array([[c, -s, tx], [s, c, ty], [0, 0, 1]])
+
+        points = np.float32([(0, 0), (10, 5), (20, 30), (40, 10)])
+        H = rotation(10, 5, -2)
+        moved_points = cv.perspectiveTransform(points[:, np.newaxis], H)[:, 0]
+        features = [cv.detail.ImageFeatures() for _ in range(2)]
+        features[0].keypoints = [cv.KeyPoint(x, y, 1) for x, y in points]
+        features[1].keypoints = [cv.KeyPoint(x, y, 1) for x, y in moved_points]
+        matches = create_matches([[0, 2], [2, 0]])
+        matches[1].matches = [cv.DMatch(i, i, 0) for i in range(len(points))]
+        matches[1].inliers_mask = np.ones(len(points), np.uint8)
+        error = CameraAdjuster("affine").get_error_function(features, matches)
+
+        # the error doesn't change if all cameras are transformed equally
+        G = rotation(30, 100, 50)
+        cameras = CameraLoader.from_homographies([G, G @ H])
+        self.assertAlmostEqual(error(cameras), 0, places=4)
+
+    def test_report_is_computed_when_read(self):
+        points = ((0, 0), (10, 5), (20, 30))
+        features = [cv.detail.ImageFeatures() for _ in range(2)]
+        features[0].keypoints = [cv.KeyPoint(x, y, 1) for x, y in points]
+        features[1].keypoints = [cv.KeyPoint(x + 5, y - 2, 1) for x, y in points]
+        matches = create_matches([[0, 2], [2, 0]])
+        matches[1].matches = [cv.DMatch(i, i, 0) for i in range(3)]
+        matches[1].inliers_mask = np.ones(3, np.uint8)
+        matches[1].num_inliers = 3
+        matches[1].H = np.array([[1, 0, 5], [0, 1, -2], [0, 0, 1]], np.float64)
+        cameras = CameraLoader.from_homographies([np.eye(3), np.eye(3)])
+        adjuster = CameraAdjuster("translation")
+
+        with patch.object(
+            adjuster, "get_error_function", wraps=adjuster.get_error_function
+        ) as get_error_function:
+            adjuster.adjust(features, matches, cameras)
+            get_error_function.assert_not_called()
+            report = adjuster.report
+            self.assertIs(adjuster.report, report)
+            get_error_function.assert_called_once()
+
+        self.assertIsNone(report.steps)
+        self.assertAlmostEqual(report.initial_error, np.sqrt(29))
+        self.assertAlmostEqual(report.final_error, 0)
+
+
+def start_test():
+    unittest.main()
+
+
+if __name__ == "__main__":
+    start_test()
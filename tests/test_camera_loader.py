@@ -0,0 +1,72 @@
+import json
+import unittest
+
+import numpy as np
+
+from .context import CameraLoader, StitchingError, test_output
+
+K = [[1000.0, 0.0, 400.0], [0.0, 1000.0, 300.0], [0.0, 0.0, 1.0]]
+R = [[1.0, 0.0, 0.0], [0.0, 0.0, -1.0], [0.0, 1.0, 0.0]]
+H = [[1.0, 0.0, 250.0], [0.0, 1.0, -10.0]]
+
+
+class TestCameraLoader(unittest.TestCase):
+    def test_from_intrinsics_and_rotations(self):
+        camera = CameraLoader.from_intrinsics_and_rotations([K], [R])[0]
+
+        np.testing.assert_allclose(camera.K(), K)
+        np.testing.assert_allclose(camera.R, R)
+        self.assertEqual(camera.R.dtype, np.float32)
+
+        with self.assertRaises(StitchingError):
+            CameraLoader.from_intrinsics_and_rotations([K, K], [R])
+
+    def test_from_homographies(self):
+        camera = CameraLoader.from_homographies([H])[0]
+
+        np.testing.assert_allclose(camera.K(), np.eye(3))
+        np.testing.assert_allclose(camera.R[:2], H)
+        np.testing.assert_allclose(camera.R[2], [0, 0, 1])
+
+    def test_read_json(self):
+        filename = test_output("given_cameras.json")
+        with open(filename, "w") as file:
+            json.dump([{"K": K, "R": R}, {"H": H}], file)
+
+        cameras = CameraLoader.read_json(filename)
+
+        self.assertEqual(len(cameras), 2)
+        np.testing.assert_allclose(cameras[0].K(), K)
+        np.testing.assert_allclose(cameras[1].R[:2], H)
+
+        with self.assertRaises(StitchingError) as cm:
+            CameraLoader.from_dicts([{"K": K}])
+        self.assertTrue(str(cm.exception).startswith("Camera 1 needs"))
+
+    def test_rescale(self):
+        camera = CameraLoader.from_intrinsics_and_rotations([K], [R])[0]
+        scaled = CameraLoader.rescale([camera], 0.5)[0]
+
+        np.testing.assert_allclose(scaled.K(), np.array(K) * [[0.5], [0.5], [1]])
+        np.testing.assert_allclose(scaled.R, R)
+        np.testing.assert_allclose(camera.K(), K)  # original is unchanged
+
+        camera = CameraLoader.from_homographies([H])[0]
+        scaled = CameraLoader.rescale([camera], 0.5, affine=True)[0]
+
+        np.testing.assert_allclose(scaled.K(), np.eye(3))
+        np.testing.assert_allclose(scaled.R[:2], [[1, 0, 125], [0, 1, -5]])
+
+    def test_check_number_of_cameras(self):
+        cameras = CameraLoader.from_homographies([H])
+        with self.assertRaises(StitchingError) as cm:
+            CameraLoader.check_number_of_cameras(cameras, 2)
+        self.assertTrue(str(cm.exception).startswith("1 cameras given for 2 images"))
+
+
+def start_test():
+    unittest.main()
+
+
+if __name__ == "__main__":
+    start_test()
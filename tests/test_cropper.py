@@ -0,0 +1,111 @@
+import unittest
+from itertools import combinations
+
+import cv2 as cv
+import largestinteriorrectangle
+import numpy as np
+
+from .context import (
+    Blender,
+    Cropper,
+    Rectangle,
+    RoiIndex,
+    StitchingError,
+    get_intersection,
+)
+
+
+def create_random_rectangles(rng, nr_rectangles=50):
+    corners = rng.integers(-100, 500, (nr_rectangles, 2))
+    sizes = rng.integers(0, 120, (nr_rectangles, 2))
+    return [Rectangle(*corner, *size) for corner, size in zip(corners, sizes)]
+
+
+def brute_force_largest_area(grid):
+    sums = np.zeros((grid.shape[0] + 1, grid.shape[1] + 1), int)
+    sums[1:, 1:] = np.cumsum(np.cumsum(grid, 0), 1)
+    largest_area = 0
+    for y1 in range(grid.shape[0]):
+        for x1 in range(grid.shape[1]):
+            for y2 in range(y1 + 1, grid.shape[0] + 1):
+                for x2 in range(x1 + 1, grid.shape[1] + 1):
+                    area = (y2 - y1) * (x2 - x1)
+                    true_cells = sums[y2, x2] - sums[y1, x2] - sums[y2, x1]
+                    if true_cells + sums[y1, x1] == area:
+                        largest_area = max(largest_area, area)
+    return largest_area
+
+
+class TestCropper(unittest.TestCase):
+    def test_largest_interior_rectangle(self):
+        rng = np.random.default_rng(0)
+        for _ in range(100):
+            grid = rng.random((8, 10)) < 0.8
+            if not grid.any():
+                continue
+            lir = Cropper.largest_interior_rectangle(grid)
+
+            self.assertEqual(lir.area, brute_force_largest_area(grid))
+            self.assertTrue(np.all(Cropper.crop_rectangle(grid, lir)))
+
+    def test_largest_interior_rectangle_equals_lir_package(self):
+        mask = np.zeros((300, 900), np.uint8)
+        cv.ellipse(mask, (450, 150), (440, 140), 0, 0, 360, 255, -1)
+        cv.rectangle(mask, (100, 20), (300, 280), 255, -1)
+        contours, _ = cv.findContours(mask, cv.RETR_TREE, cv.CHAIN_APPROX_NONE)
+
+        expected = largestinteriorrectangle.lir(mask > 0, contours[0][:, 0, :])
+        lir = Cropper().estimate_largest_interior_rectangle(mask)
+
+        self.assertEqual(lir, Rectangle(*expected))
+
+    def test_ties_are_resolved_top_left(self):
+        grid = np.zeros((5, 7), bool)
+        grid[1:3, 1:4] = True
+        grid[3:5, 4:7] = True
+        self.assertEqual(Cropper.largest_interior_rectangle(grid), (1, 1, 3, 2))
+
+    def test_create_panorama_mask(self):
+        rng = np.random.default_rng(0)
+        masks = [(rng.random((20, 30)) < 0.9).astype(np.uint8) * 255 for _ in range(3)]
+        corners = [(-5, 10), (15, 0), (30, 12)]
+        sizes = [(30, 20)] * 3
+        imgs = [np.zeros((20, 30, 3), np.uint8)] * 3
+        _, expected = Blender.create_panorama(imgs, masks, corners, sizes)
+
+        mask = Cropper.create_panorama_mask(masks, corners, sizes)
+        np.testing.assert_array_equal(mask, expected)
+
+    def test_roi_index(self):
+        rng = np.random.default_rng(0)
+        for _ in range(20):
+            rectangles = create_random_rectangles(rng)
+            roi_index = RoiIndex(rectangles)
+
+            expected_pairs = [
+                (i, j)
+                for i, j in combinations(range(len(rectangles)), 2)
+                if get_intersection(rectangles[i], rectangles[j]) is not None
+            ]
+            self.assertEqual(roi_index.overlapping_pairs(), expected_pairs)
+
+            for tile_size in (1, 100, 300):
+                tile = Rectangle(*rng.integers(-100, 500, 2), tile_size, tile_size)
+                expected_indices = [
+                    i
+                    for i, rectangle in enumerate(rectangles)
+                    if get_intersection(rectangle, tile) is not None
+                ]
+                self.assertEqual(roi_index.intersecting(tile), expected_indices)
+
+    def test_largest_interior_rectangle_of_empty_grid(self):
+        with self.assertRaises(StitchingError):
+            Cropper.largest_interior_rectangle(np.zeros((5, 5), bool))
+
+
+def start_test():
+    unittest.main()
+
+
+if __name__ == "__main__":
+    start_test()
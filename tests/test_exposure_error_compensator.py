@@ -0,0 +1,126 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import cv2 as cv
+import numpy as np
+
+from .context import ExposureErrorCompensator
+
+
+def create_frame(brightness=(0, 20, 40), seed=0):
+    rng = np.random.default_rng(seed)
+    imgs = [
+        cv.UMat((rng.random((100, 120, 3)) * 150).astype(np.uint8) + offset)
+        for offset in brightness
+    ]
+    corners = [(0, 0), (60, 10), (120, 0)]
+    masks = [cv.UMat(np.full((100, 120), 255, np.uint8)) for _ in imgs]
+    return corners, imgs, masks
+
+
+def apply_all(compensator, corners, imgs, masks):
+    return [
+        cv.UMat.get(compensator.apply(idx, corner, cv.UMat(cv.UMat.get(img)), mask))
+        for idx, (corner, img, mask) in enumerate(zip(corners, imgs, masks))
+    ]
+
+
+class TestExposureErrorCompensator(unittest.TestCase):
+    def test_write_and_read_gains(self):
+        frame = create_frame()
+        for compensator_type in ExposureErrorCompensator.COMPENSATOR_CHOICES:
+            compensator = ExposureErrorCompensator(compensator_type)
+            compensator.feed(*frame)
+
+            with tempfile.TemporaryDirectory() as tmpdir:
+                filename = os.path.join(tmpdir, "gains.npz")
+                compensator.write_gains(filename)
+                loaded_compensator = ExposureErrorCompensator(compensator_type)
+                loaded_compensator.read_gains(filename)
+
+            for gains, loaded_gains in zip(
+                compensator.get_gains(), loaded_compensator.get_gains()
+            ):
+                np.testing.assert_array_equal(gains, loaded_gains)
+            for img, loaded_img in zip(
+                apply_all(compensator, *frame), apply_all(loaded_compensator, *frame)
+            ):
+                np.testing.assert_array_equal(img, loaded_img)
+
+    def test_update_interval(self):
+        compensator = ExposureErrorCompensator("gain", update_interval=3)
+        compensator.feed(*create_frame(seed=0))
+        gains = compensator.get_gains()
+        compensator.feed(*create_frame(seed=1))
+        compensator.feed(*create_frame(seed=2))
+        for old, new in zip(gains, compensator.get_gains()):
+            np.testing.assert_array_equal(old, new)
+
+        compensator.feed(*create_frame(seed=3))
+        self.assertFalse(np.array_equal(gains[0], compensator.get_gains()[0]))
+
+    def test_brightness_drift(self):
+        compensator = ExposureErrorCompensator("gain", update_interval=100)
+        compensator.feed(*create_frame())
+        gains = compensator.get_gains()
+        compensator.feed(*create_frame(brightness=(0, 20, 60)))
+        self.assertFalse(np.array_equal(gains[0], compensator.get_gains()[0]))
+
+    def test_gain_smoothing(self):
+        estimator = ExposureErrorCompensator("gain_blocks")
+        estimator.feed(*create_frame(brightness=(0, 20, 60)))
+        estimated_gains = estimator.get_gains()
+
+        compensator = ExposureErrorCompensator("gain_blocks", gain_smoothing=0.75)
+        compensator.feed(*create_frame())
+        previous_gains = compensator.get_gains()
+        compensator.feed(*create_frame(brightness=(0, 20, 60)))
+
+        for previous, estimated, smoothed in zip(
+            previous_gains, estimated_gains, compensator.get_gains()
+        ):
+            np.testing.assert_allclose(
+                smoothed, 0.75 * previous + 0.25 * estimated, rtol=1e-6
+            )
+
+    def test_gains_are_only_copied_for_smoothing(self):
+        for gain_smoothing, copies in ((0, 0), (0.5, 4)):
+            compensator = ExposureErrorCompensator(
+                "gain_blocks", gain_smoothing=gain_smoothing
+            )
+            with patch.object(
+                compensator, "get_gains", wraps=compensator.get_gains
+            ) as get_gains:
+                compensator.feed(*create_frame())
+                compensator.feed(*create_frame(brightness=(0, 20, 60)))
+            self.assertEqual(get_gains.call_count, copies)
+
+    def test_apply_to_images(self):
+        frame = create_frame()
+        rng = np.random.default_rng(0)
+        imgs = [(rng.random((517, 613, 3)) * 255).astype(np.uint8) for _ in range(3)]
+        corners = [(0, 0), (300, 50), (600, 0)]
+        mask = np.full((517, 613), 255, np.uint8)
+        for compensator_type in ExposureErrorCompensator.COMPENSATOR_CHOICES:
+            compensator = ExposureErrorCompensator(compensator_type, nr_workers=2)
+            compensator.feed(*frame)
+
+            expected = [
+                compensator.apply(idx, corner, np.copy(img), mask)
+                for idx, (corner, img) in enumerate(zip(corners, imgs))
+            ]
+            compensated = compensator.apply_to_images(
+                corners, [np.copy(img) for img in imgs]
+            )
+            for expected_img, img in zip(expected, compensated):
+                np.testing.assert_array_equal(img, expected_img)
+
+
+def start_test():
+    unittest.main()
+
+
+if __name__ == "__main__":
+    start_test()
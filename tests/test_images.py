@@ -2,7 +2,14 @@ import unittest
 
 import numpy as np
 
-from .context import Images, _FilenameImages, _NumpyImages, load_test_img, test_input
+from .context import (
+    Images,
+    StitchingError,
+    _FilenameImages,
+    _NumpyImages,
+    load_test_img,
+    test_input,
+)
 
 
 class TestImages(unittest.TestCase):
@@ -48,6 +55,16 @@ class TestImages(unittest.TestCase):
         images = Images.of(["1", "2"], 10)
         self.assertEqual(images._scalers["MEDIUM"].megapix, 10)
 
+    def test_seam_resolution(self):
+        images = Images.of(["1", "2"])
+        self.assertEqual(images._scalers["SEAM"].megapix, Images.Resolution.LOW.value)
+
+        images = Images.of(["1", "2"], seam_megapix=0.3)
+        self.assertEqual(images._scalers["SEAM"].megapix, 0.3)
+
+        with self.assertRaises(StitchingError):
+            Images.of(["1", "2"], seam_megapix=1)
+
 
 def start_test():
     unittest.main()
@@ -0,0 +1,135 @@
+import unittest
+from unittest.mock import patch
+
+import cv2 as cv
+import numpy as np
+
+from .context import (
+    AffineStitcher,
+    CameraLoader,
+    Images,
+    IncrementalStitcher,
+    StitchingError,
+    load_test_img,
+    test_input,
+    write_test_result,
+)
+
+
+def get_placement(stitcher, i, j):
+    """The corners of the image j in the pixels of image i (at medium
+    resolution), which don't depend on the anchor of the camera estimation"""
+    camera_i, camera_j = stitcher.cameras[i], stitcher.cameras[j]
+    H = camera_i.K() @ np.linalg.inv(camera_i.R) @ camera_j.R
+    H = H @ np.linalg.inv(camera_j.K())
+    width, height = stitcher.images.get_scaled_img_sizes(Images.Resolution.MEDIUM)[j]
+    corners = np.float64([[0, 0], [width, 0], [width, height], [0, height]])
+    return cv.perspectiveTransform(corners.reshape(-1, 1, 2), H)
+
+
+class TestIncrementalStitcher(unittest.TestCase):
+    def test_add_image(self):
+        imgs = [test_input("weir_1.jpg"), test_input("weir_2.jpg")]
+        new_img = test_input("weir_3.jpg")
+        for settings in ({}, AffineStitcher.AFFINE_DEFAULTS):
+            cv.setRNGSeed(0)
+            batch_stitcher = IncrementalStitcher(**settings)
+            batch_stitcher.stitch(imgs + [new_img])
+
+            cv.setRNGSeed(0)
+            stitcher = IncrementalStitcher(**settings)
+            stitcher.stitch(imgs)
+            result = stitcher.add_image(new_img)
+            write_test_result("weir_incremental.jpg", result)
+
+            self.assertEqual(len(stitcher.cameras), 3)
+            np.testing.assert_allclose(
+                get_placement(stitcher, 1, 2),
+                get_placement(batch_stitcher, 1, 2),
+                atol=3,
+            )
+
+    def test_add_image_without_adjustment(self):
+        imgs = [test_input("weir_1.jpg"), test_input("weir_2.jpg")]
+        new_img = test_input("weir_3.jpg")
+        settings = dict(AffineStitcher.AFFINE_DEFAULTS, adjuster="no")
+        cv.setRNGSeed(0)
+        batch_stitcher = IncrementalStitcher(**settings)
+        batch_stitcher.stitch(imgs + [new_img])
+
+        cv.setRNGSeed(0)
+        stitcher = IncrementalStitcher(**settings)
+        stitcher.stitch(imgs)
+        stitcher.add_image(new_img)
+
+        # the new camera is chained with its neighbour like the estimator does
+        np.testing.assert_allclose(
+            get_placement(stitcher, 1, 2),
+            get_placement(batch_stitcher, 1, 2),
+            atol=3,
+        )
+
+    def test_add_image_with_given_camera(self):
+        imgs = [test_input("weir_1.jpg"), test_input("weir_2.jpg")]
+        new_img = test_input("weir_3.jpg")
+        stitcher = IncrementalStitcher()
+        reference = stitcher.stitch(imgs + [new_img])
+        medium_scale = stitcher.images.get_scale(Images.Resolution.MEDIUM)
+        cameras = CameraLoader.rescale(stitcher.cameras, 1 / medium_scale)
+
+        stitcher = IncrementalStitcher()
+        stitcher.stitch(imgs, cameras=cameras[:2])
+        result = stitcher.add_image(new_img, camera=cameras[2])
+
+        np.testing.assert_allclose(result.shape[:2], reference.shape[:2], atol=3)
+
+    def test_only_the_new_image_is_warped(self):
+        imgs = [test_input("weir_1.jpg"), test_input("weir_2.jpg")]
+        stitcher = IncrementalStitcher()
+        stitcher.stitch(imgs)
+
+        with patch.object(stitcher, "warp", wraps=stitcher.warp) as warp:
+            stitcher.add_image(test_input("weir_3.jpg"))
+            # at low and final resolution
+            self.assertEqual(warp.call_count, 2)
+            for call in warp.call_args_list:
+                self.assertEqual(call.args[1], [stitcher.cameras[2]])
+
+            warp.reset_mock()
+            stitcher.replace_image(1, test_input("weir_2.jpg"))
+            self.assertEqual(warp.call_count, 2)
+            for call in warp.call_args_list:
+                self.assertEqual(call.args[1], [stitcher.cameras[1]])
+
+    def test_replace_image(self):
+        imgs = [load_test_img("weir_1.jpg"), load_test_img("weir_2.jpg")]
+        stitcher = IncrementalStitcher()
+        panorama = np.copy(stitcher.stitch(imgs))
+        result = stitcher.replace_image(1, cv.convertScaleAbs(imgs[1], alpha=0.5))
+
+        self.assertEqual(result.shape, panorama.shape)
+        changed_columns = np.where(np.any(result != panorama, axis=(0, 2)))[0]
+        self.assertGreater(changed_columns.min(), 0)
+
+        with self.assertRaises(StitchingError) as cm:
+            stitcher.replace_image(1, imgs[1][:100])
+        self.assertTrue(str(cm.exception).startswith("The replacing image has size"))
+        with self.assertRaises(StitchingError):
+            stitcher.replace_image(2, imgs[1])
+
+    def test_add_image_before_stitch(self):
+        with self.assertRaises(StitchingError) as cm:
+            IncrementalStitcher().add_image(test_input("weir_1.jpg"))
+        self.assertEqual(str(cm.exception), "Images can only be added after stitch()")
+
+    def test_crop_is_not_supported(self):
+        with self.assertRaises(StitchingError):
+            IncrementalStitcher(crop=True)
+
+
+def start_test():
+    unittest.main()
+
+
+if __name__ == "__main__":
+    start_test()
@@ -2,7 +2,7 @@ import unittest
 
 import numpy as np
 
-from .context import FeatureMatcher
+from .context import FeatureDetector, FeatureMatcher, load_test_img
 
 
 class TestMatcher(unittest.TestCase):
@@ -31,6 +31,22 @@ class TestMatcher(unittest.TestCase):
         self.assertEqual(implicit_match_conf_orb, 0.3)
         self.assertEqual(implicit_match_conf_other, 0.65)
 
+    def test_translation_matcher(self):
+        img = load_test_img("weir_1.jpg")
+        imgs = [img[:500, :600], img[40:540, 250:850], img[:100, :100]]
+        features = [FeatureDetector().detect_features(img) for img in imgs]
+        matcher = FeatureMatcher("translation", match_conf=0.3)
+
+        matches = matcher.match_features(features)
+
+        self.assertEqual(len(matches), 9)
+        np.testing.assert_allclose(matches[1].H[:2, 2], [-250, -40], atol=1)
+        np.testing.assert_allclose(matches[3].H[:2, 2], [250, 40], atol=1)
+        self.assertEqual((matches[3].src_img_idx, matches[3].dst_img_idx), (1, 0))
+        self.assertGreater(matches[1].confidence, 1)
+        self.assertEqual(matches[1].confidence, matches[3].confidence)
+        self.assertEqual(matches[0].src_img_idx, -1)
+
 
 def start_test():
     unittest.main()
@@ -0,0 +1,44 @@
+import threading
+import time
+import unittest
+
+from .context import parallel_map
+
+
+class TestParallel(unittest.TestCase):
+    def test_parallel_map_keeps_order(self):
+        def delayed_square(x, delay):
+            time.sleep(delay)
+            return x * x
+
+        delays = [0.02, 0.0, 0.01, 0.0, 0.03, 0.0]
+        for nr_workers in (1, 3):
+            results = parallel_map(
+                delayed_square, range(6), delays, nr_workers=nr_workers
+            )
+            self.assertEqual(list(results), [0, 1, 4, 9, 16, 25])
+
+    def test_parallel_map_is_bounded(self):
+        lock = threading.Lock()
+        consumed, in_flight = [], []
+
+        def inputs():
+            for x in range(20):
+                with lock:
+                    in_flight.append(x - len(consumed))
+                yield x
+
+        for x in parallel_map(lambda x: x, inputs(), nr_workers=2):
+            consumed.append(x)
+            time.sleep(0.001)
+
+        self.assertEqual(consumed, list(range(20)))
+        self.assertLessEqual(max(in_flight), 4)
+
+
+def start_test():
+    unittest.main()
+
+
+if __name__ == "__main__":
+    start_test()
@@ -1,23 +1,183 @@
+import os
+import subprocess
+import sys
 import time
 import tracemalloc
 import unittest
+from itertools import combinations
+
+import cv2 as cv
+import numpy as np
 
 from .context import (
     Blender,
     CameraAdjuster,
     CameraEstimator,
+    CameraLoader,
     ExposureErrorCompensator,
     FeatureDetector,
     FeatureMatcher,
     Images,
+    Rectangle,
+    RoiIndex,
     SeamFinder,
     Stitcher,
     Subsetter,
     Warper,
     WaveCorrector,
+    get_intersection,
+    remove_invalid_line_pixels,
     test_input,
 )
 from .stitching_detailed import main
+from .test_seam_finder import remove_invalid_line_pixels_per_pixel
+
+# Comparisons of wall-clock times and memory peaks depend on the machine and
+# its load, they only run with STITCHING_BENCHMARKS=1
+benchmark = unittest.skipUnless(
+    os.environ.get("STITCHING_BENCHMARKS") == "1", "STITCHING_BENCHMARKS is not 1"
+)
+
+LIR_BENCHMARK = """
+import time
+import cv2 as cv
+import numpy as np
+mask = np.zeros((600, 1800), np.uint8)
+cv.ellipse(mask, (900, 300), (880, 280), 0, 0, 360, 255, -1)
+contour = cv.findContours(mask, cv.RETR_TREE, cv.CHAIN_APPROX_NONE)[0][0][:, 0, :]
+start = time.time()
+{}
+cold = time.time() - start
+start = time.time()
+for _ in range(3):
+    {}
+warm = (time.time() - start) / 3
+print(cold, warm)
+"""
+
+BUILTIN_LIR = (
+    "from stitching.cropper import Cropper",
+    "Cropper.largest_interior_rectangle(mask > 0)",
+)
+PACKAGE_LIR = (
+    "import largestinteriorrectangle",
+    "largestinteriorrectangle.lir(mask > 0, contour)",
+)
+
+
+IMPORT_BENCHMARK = """
+import time
+start = time.time()
+import cv2, numpy
+dependencies = time.time() - start
+start = time.time()
+import {}
+print(dependencies, time.time() - start)
+"""
+
+BLEND_BENCHMARK = """
+import resource
+import cv2 as cv
+import numpy as np
+from stitching.blender import Blender
+from stitching.tiled_blender import TiledBlender
+
+
+class Int16Blender(Blender):
+    # feeds int16 copies and converts the whole UMat result
+
+    def feed(self, img, mask, corner):
+        self.blender.feed(cv.UMat(img.astype(np.int16)), mask, corner)
+
+    def blend(self):
+        result, result_mask = self.blender.blend(None, None)
+        return cv.convertScaleAbs(result), result_mask
+
+
+blender = {}
+corners = [(x, y) for y in (0, 1800) for x in (0, 2700, 5400)]
+sizes = [(3000, 2000)] * len(corners)
+img = np.full((2000, 3000, 3), 128, np.uint8)
+mask = np.full((2000, 3000), 255, np.uint8)
+blender.prepare(corners, sizes)
+for corner in corners:
+    blender.feed(img, mask, corner)
+panorama, _ = blender.blend()
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(peak / 1024, panorama.shape[0])
+"""
+
+
+def run_in_fresh_process(code):
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return [float(time) for time in output.split()]
+
+
+class SeamBenchmarkStitcher(Stitcher):
+    """Measures the seam finding and keeps the final seam masks"""
+
+    def find_seam_masks(self, imgs, corners, masks):
+        start = time.time()
+        seam_masks = super().find_seam_masks(imgs, corners, masks)
+        self.seam_time = time.time() - start
+        return seam_masks
+
+    def blend_images(self, imgs, masks, corners):
+        self.final_seam_masks, self.final_corners = [], corners
+        super().blend_images(imgs, self.keep_seam_masks(masks), corners)
+
+    def keep_seam_masks(self, seam_masks):
+        for seam_mask in seam_masks:
+            self.final_seam_masks.append(cv.UMat.get(seam_mask))
+            yield seam_mask
+
+
+def run_seam_benchmark(imgs, cameras, finder, seam_megapix):
+    """Returns the time of the seam finding and the seam visibility"""
+    stitcher = SeamBenchmarkStitcher(
+        finder=finder,
+        seam_megapix=seam_megapix,
+        final_megapix=1,
+        blender_type="no",
+    )
+    panorama = stitcher.stitch(imgs, cameras=cameras)
+    visibility = seam_visibility(
+        panorama, stitcher.final_seam_masks, stitcher.final_corners
+    )
+    return stitcher.seam_time, visibility
+
+
+def seam_visibility(panorama, seam_masks, corners):
+    """Mean color jump between neighbouring pixels of different images in
+    the unblended panorama (which the seam finders minimize)"""
+    labels = np.zeros(panorama.shape[:2], np.int32)
+    min_x, min_y = min(x for x, _ in corners), min(y for _, y in corners)
+    for idx, (seam_mask, (x, y)) in enumerate(zip(seam_masks, corners)):
+        height, width = seam_mask.shape
+        region = labels[y - min_y : y - min_y + height, x - min_x : x - min_x + width]
+        region[seam_mask > 0] = idx + 1
+    panorama = panorama.astype(np.int32)
+    jumps = []
+    for labels1, labels2, pixels1, pixels2 in (
+        (labels[:-1], labels[1:], panorama[:-1], panorama[1:]),
+        (labels[:, :-1], labels[:, 1:], panorama[:, :-1], panorama[:, 1:]),
+    ):
+        seams = (labels1 != labels2) & (labels1 > 0) & (labels2 > 0)
+        jumps.append(np.abs(pixels1 - pixels2).sum(axis=2)[seams])
+    return np.concatenate(jumps).mean()
+
+
+def run_lir_benchmark(import_statement, lir_call):
+    """Runs the lir in a fresh process, returns the time of the first
+    (including the import) and the mean time of following calls"""
+    code = LIR_BENCHMARK.format(f"{import_statement}; {lir_call}", lir_call)
+    return run_in_fresh_process(code)
 
 
 class TestStitcher(unittest.TestCase):
@@ -99,6 +259,187 @@ class TestStitcher(unittest.TestCase):
         allowed_deviation = time_needed / 100 * allowed_deviation_in_percent
         self.assertLessEqual(time_needed - allowed_deviation, time_needed_detailed)
 
+    @benchmark
+    def test_largest_interior_rectangle_performance(self):
+        builtin_cold, builtin_warm = run_lir_benchmark(*BUILTIN_LIR)
+        package_cold, package_warm = run_lir_benchmark(*PACKAGE_LIR)
+
+        # print(f"Built-in lir cold {builtin_cold} s, warm {builtin_warm} s")
+        # print(f"Package lir cold {package_cold} s, warm {package_warm} s")
+
+        self.assertLess(builtin_cold, package_cold)
+        self.assertLess(builtin_warm, 1)
+
+    @benchmark
+    def test_seam_resolution_performance(self):
+        imgs = [
+            test_input("boat5.jpg"),
+            test_input("boat2.jpg"),
+            test_input("boat3.jpg"),
+            test_input("boat4.jpg"),
+            test_input("boat1.jpg"),
+            test_input("boat6.jpg"),
+        ]
+        stitcher = Stitcher()
+        stitcher.images = Images.of(imgs)
+        medium_imgs = stitcher.resize_medium_resolution()
+        features = stitcher.find_features(medium_imgs)
+        matches = stitcher.match_features(features)
+        cameras = stitcher.estimate_camera_parameters(features, matches)
+        cameras = stitcher.refine_camera_parameters(features, matches, cameras)
+        cameras = stitcher.perform_wave_correction(cameras)
+        cameras = CameraLoader.rescale(
+            cameras, 1 / stitcher.images.get_scale(Images.Resolution.MEDIUM)
+        )
+
+        for finder in SeamFinder.SEAM_FINDER_CHOICES:
+            seam_times = []
+            for seam_megapix in (0.05, 0.1, 0.3):
+                seam_time, visibility = run_seam_benchmark(
+                    imgs, cameras, finder, seam_megapix
+                )
+                seam_times.append(seam_time)
+
+                # print(f"{finder} at {seam_megapix} Mpx: {seam_time} s, "
+                #       f"seam visibility {visibility}")
+
+            if finder != "no":
+                self.assertLess(seam_times[0], seam_times[-1])
+
+    @benchmark
+    def test_seam_lines_performance(self):
+        height, width = 2000, 3000
+        seam_masks = [np.zeros((height, width // 3), np.uint8) for _ in range(4)]
+        for seam_mask in seam_masks:
+            cv.ellipse(seam_mask, (500, 1000), (480, 980), 0, 0, 360, 255, -1)
+        corners = [(x, 0) for x in range(0, width, width // 4)]
+        sizes = [(width // 3, height)] * 4
+        blended_seam_masks = SeamFinder.blend_seam_masks(seam_masks, corners, sizes)
+        lines = cv.Canny(blended_seam_masks, 100, 200)
+
+        start = time.time()
+        remove_invalid_line_pixels_per_pixel(lines.copy(), blended_seam_masks)
+        per_pixel_time = time.time() - start
+
+        start = time.time()
+        remove_invalid_line_pixels(lines.copy(), blended_seam_masks)
+        vectorized_time = time.time() - start
+
+        # print(f"Seam lines per pixel {per_pixel_time} s, "
+        #       f"vectorized {vectorized_time} s")
+
+        self.assertLess(vectorized_time * 10, per_pixel_time)
+
+    @benchmark
+    def test_roi_index_performance(self):
+        # a scan of 40 x 40 tiles with 10 % overlap
+        rectangles = [
+            Rectangle(x * 90, y * 90, 100, 100) for y in range(40) for x in range(40)
+        ]
+
+        start = time.time()
+        pairs = [
+            (i, j)
+            for i, j in combinations(range(len(rectangles)), 2)
+            if get_intersection(rectangles[i], rectangles[j]) is not None
+        ]
+        all_pairs_time = time.time() - start
+
+        start = time.time()
+        indexed_pairs = RoiIndex(rectangles).overlapping_pairs()
+        index_time = time.time() - start
+
+        # print(f"Overlapping pairs of all pairs {all_pairs_time} s, "
+        #       f"with index {index_time} s")
+
+        tiles = [
+            Rectangle(x, y, 256, 256) for y in range(0, 3600, 256) for x in (0, 1800)
+        ]
+        start = time.time()
+        for tile in tiles:
+            [i for i, r in enumerate(rectangles) if get_intersection(r, tile)]
+        scan_time = time.time() - start
+
+        roi_index = RoiIndex(rectangles)
+        start = time.time()
+        for tile in tiles:
+            roi_index.intersecting(tile)
+        intersecting_time = time.time() - start
+
+        # print(f"Intersecting rectangles of tiles scanned {scan_time} s, "
+        #       f"with index {intersecting_time} s")
+
+        self.assertEqual(indexed_pairs, pairs)
+        self.assertLess(index_time * 10, all_pairs_time)
+        self.assertLess(intersecting_time * 5, scan_time)
+
+    @benchmark
+    def test_exposure_compensation_performance(self):
+        rng = np.random.default_rng(0)
+        low_imgs = [
+            cv.UMat((rng.random((100, 120, 3)) * 150).astype(np.uint8) + offset)
+            for offset in (0, 20, 60)
+        ]
+        low_corners = [(0, 0), (60, 10), (120, 0)]
+        low_masks = [cv.UMat(np.full((100, 120), 255, np.uint8)) for _ in low_imgs]
+        imgs = [(rng.random((2000, 3000, 3)) * 255).astype(np.uint8) for _ in range(3)]
+        corners = [(0, 0), (1500, 100), (3000, 0)]
+        mask = np.full((2000, 3000), 255, np.uint8)
+
+        for compensator_type in ("gain", "gain_blocks"):
+            compensator = ExposureErrorCompensator(compensator_type)
+            compensator.feed(low_corners, low_imgs, low_masks)
+
+            start = time.time()
+            for idx, (corner, img) in enumerate(zip(corners, imgs)):
+                compensator.apply(idx, corner, np.copy(img), mask)
+            apply_time = time.time() - start
+
+            start = time.time()
+            list(compensator.apply_to_images(corners, map(np.copy, imgs)))
+            apply_to_images_time = time.time() - start
+
+            # print(f"{compensator_type} apply {apply_time} s, "
+            #       f"apply_to_images {apply_to_images_time} s")
+
+            self.assertLess(apply_to_images_time, apply_time)
+
+    @benchmark
+    def test_tiled_blending_memory(self):
+        peak, _ = run_in_fresh_process(BLEND_BENCHMARK.format("Blender()"))
+        tiled_peak, _ = run_in_fresh_process(
+            BLEND_BENCHMARK.format("TiledBlender(tile_size=1024)")
+        )
+
+        # print(f"Peak memory of blending {peak} MB, tiled {tiled_peak} MB")
+
+        self.assertLess(tiled_peak * 1.5, peak)
+
+    @benchmark
+    def test_blending_memory(self):
+        # the peak of multiband blending is dominated by opencv's pyramids
+        for blender_type in ("feather", "no"):
+            int16_peak, _ = run_in_fresh_process(
+                BLEND_BENCHMARK.format(f"Int16Blender('{blender_type}')")
+            )
+            peak, _ = run_in_fresh_process(
+                BLEND_BENCHMARK.format(f"Blender('{blender_type}')")
+            )
+
+            # print(f"Peak memory of {blender_type} blending {peak} MB, "
+            #       f"with int16 copies {int16_peak} MB")
+
+            self.assertLess(peak, int16_peak)
+
+    @benchmark
+    def test_import_performance(self):
+        for module in ("stitching", "stitching.cli.stitch"):
+            _, import_time = run_in_fresh_process(IMPORT_BENCHMARK.format(module))
+
+            # print(f"Import of {module} (without cv2 and numpy) {import_time} s")
+
+            self.assertLess(import_time, 0.5)
+
 
 def starttest():
     unittest.main()
@@ -0,0 +1,132 @@
+import unittest
+
+import cv2 as cv
+import numpy as np
+
+from .context import Blender, SeamFinder
+
+
+def create_grid(rows=1, cols=4):
+    rng = np.random.default_rng(0)
+    size = (200 * rows + 50, 150 * cols + 100, 3)
+    panorama = (rng.random(size) * 255).astype(np.uint8)
+    panorama = cv.GaussianBlur(panorama, (0, 0), 3)
+    imgs, corners, masks = [], [], []
+    for row in range(rows):
+        for col in range(cols):
+            x, y = 150 * col, 200 * row + int(rng.integers(0, 20))
+            img = panorama[y : y + 230, x : x + 250]
+            imgs.append(cv.add(img, (len(imgs) * 5, 0, 0, 0)))
+            corners.append((x, y))
+            masks.append(np.full(img.shape[:2], 255, np.uint8))
+    return imgs, corners, masks
+
+
+def remove_invalid_line_pixels_per_pixel(lines, mask):
+    """The former implementation, which checks the line pixels one by one"""
+    for x, y in zip(*lines.nonzero()):
+        for dx, dy in ((0, 0), (1, 0), (-1, 0), (0, 1), (0, -1)):
+            try:
+                if np.all(mask[x + dx, y + dy] == 0):
+                    lines[x, y] = 0
+            except IndexError:
+                pass
+    return lines
+
+
+def create_seam_masks(nr_masks=5):
+    rng = np.random.default_rng(0)
+    seam_masks, corners, sizes = [], [], []
+    for _ in range(nr_masks):
+        width, height = rng.integers(40, 120, 2)
+        seam_mask = np.zeros((height, width), np.uint8)
+        center = rng.integers(0, (width, height))
+        axes = rng.integers(10, (width, height))
+        cv.ellipse(seam_mask, center, axes, 0, 0, 360, 255, -1)
+        seam_masks.append(seam_mask)
+        corners.append(tuple(rng.integers(-50, 100, 2)))
+        sizes.append((width, height))
+    return seam_masks, corners, sizes
+
+
+class TestSeamFinder(unittest.TestCase):
+    def test_seam_finders_are_created_when_selected(self):
+        for finder in SeamFinder.SEAM_FINDER_CHOICES:
+            self.assertIsNot(SeamFinder(finder).finder, SeamFinder(finder).finder)
+
+    def test_overlap_bands(self):
+        imgs, corners, masks = create_grid()
+        for finder in SeamFinder.SEAM_FINDER_CHOICES:
+            seam_masks = SeamFinder(finder).find(imgs, corners, masks)
+            band_seam_masks = SeamFinder(finder, overlap_bands=True).find(
+                imgs, corners, masks
+            )
+            for seam_mask, band_seam_mask in zip(seam_masks, band_seam_masks):
+                np.testing.assert_array_equal(
+                    cv.UMat.get(band_seam_mask), cv.UMat.get(seam_mask)
+                )
+
+    def test_overlap_bands_with_umat_masks(self):
+        imgs, corners, masks = create_grid()
+        umat_masks = [cv.UMat(mask) for mask in masks]
+        for finder in SeamFinder.SEAM_FINDER_CHOICES:
+            seam_masks = SeamFinder(finder, True).find(imgs, corners, masks)
+            umat_seam_masks = SeamFinder(finder, True).find(imgs, corners, umat_masks)
+            for seam_mask, umat_seam_mask in zip(seam_masks, umat_seam_masks):
+                np.testing.assert_array_equal(
+                    cv.UMat.get(umat_seam_mask), cv.UMat.get(seam_mask)
+                )
+
+    def test_parallel_overlap_bands(self):
+        imgs, corners, masks = create_grid(3, 3)
+        for finder in SeamFinder.SEAM_FINDER_CHOICES:
+            seam_masks = SeamFinder(finder, True).find(imgs, corners, masks)
+            parallel_seam_masks = SeamFinder(finder, True, nr_workers=3).find(
+                imgs, corners, masks
+            )
+            for seam_mask, parallel_seam_mask in zip(seam_masks, parallel_seam_masks):
+                np.testing.assert_array_equal(
+                    cv.UMat.get(parallel_seam_mask), cv.UMat.get(seam_mask)
+                )
+
+    def test_blend_seam_masks(self):
+        seam_masks, corners, sizes = create_seam_masks()
+        colors = [(255, 0, 0), (0, 0, 255), (0, 255, 0), (0, 255, 255)] * 2
+        imgs = [np.full((h, w, 3), c, np.uint8) for (w, h), c in zip(sizes, colors)]
+        expected, _ = Blender.create_panorama(imgs, seam_masks, corners, sizes)
+
+        blended_seam_masks = SeamFinder.blend_seam_masks(
+            seam_masks, corners, sizes, colors
+        )
+        np.testing.assert_array_equal(blended_seam_masks, expected)
+
+    def test_extract_seam_lines(self):
+        # the seam reaches the first row, the last row is black
+        two_masks = np.zeros((20, 30, 3), np.uint8)
+        two_masks[:-1, :15] = (255, 0, 0)
+        two_masks[:-1, 15:] = (0, 0, 255)
+
+        for blended_seam_masks in (
+            SeamFinder.blend_seam_masks(*create_seam_masks()),
+            two_masks,
+        ):
+            lines = cv.Canny(blended_seam_masks, 100, 200)
+            expected = remove_invalid_line_pixels_per_pixel(lines, blended_seam_masks)
+
+            seam_lines = SeamFinder.extract_seam_lines(blended_seam_masks)
+            np.testing.assert_array_equal(seam_lines, expected)
+
+    def test_schedule_pairs(self):
+        pairs = [(0, 1), (2, 3), (1, 2), (0, 3), (1, 3), (4, 5), (0, 2)]
+        batches = SeamFinder.schedule_pairs(pairs)
+        self.assertEqual(
+            batches, [[(0, 1), (2, 3), (4, 5)], [(1, 2), (0, 3)], [(1, 3), (0, 2)]]
+        )
+
+
+def start_test():
+    unittest.main()
+
+
+if __name__ == "__main__":
+    start_test()
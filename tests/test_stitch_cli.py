@@ -18,6 +18,10 @@ class TestCLI(unittest.TestCase):
         parsed = self.parser.parse_args(["img*.jpg", "--low_megapix", "1"])
         self.assertEqual(parsed.low_megapix, 1.0)
 
+    def test_affine_and_translation_are_exclusive(self):
+        with patch("sys.stderr"), self.assertRaises(SystemExit):
+            self.parser.parse_args(["img*.jpg", "--affine", "--translation"])
+
     def test_main(self):
         output = test_output("weir_from_cli.jpg")
         test_args = [
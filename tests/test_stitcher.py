@@ -1,15 +1,20 @@
 import os
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+import cv2 as cv
 import numpy as np
 
 from .context import (
     VERBOSE_DIR,
     AffineStitcher,
+    CameraLoader,
+    Images,
     Stitcher,
     StitchingError,
     StitchingWarning,
+    TranslationStitcher,
     load_test_img,
     test_input,
     test_output,
@@ -129,6 +134,123 @@ class TestStitcher(unittest.TestCase):
             stitcher, imgs, expected_shape, max_derivation, name, verbose=False
         )
 
+    def test_stitcher_hierarchical_adjustment(self):
+        imgs = [test_input(f"boat{i}.jpg") for i in range(1, 7)]
+        cv.setRNGSeed(0)
+        stitcher = Stitcher(crop=False)
+        reference = stitcher.stitch(imgs)
+        reference_error = stitcher.adjustment_report.final_error
+
+        cv.setRNGSeed(0)
+        stitcher = Stitcher(crop=False, adjuster_cluster_size=3, nr_workers=2)
+        result = stitcher.stitch(imgs)
+
+        # the clusters are aligned about as well as a global adjustment
+        self.assertLess(stitcher.adjustment_report.final_error, reference_error + 0.5)
+        np.testing.assert_allclose(result.shape, reference.shape, rtol=0.02)
+
+    def test_concurrent_stitchers(self):
+        imgs = [test_input("s1.jpg"), test_input("s2.jpg")]
+        settings = [
+            {},
+            {"finder": "gc_color", "compensator": "channel"},
+            {"blender_type": "feather", "crop": False},
+            {"finder": "dp_colorgrad", "warper_type": "cylindrical"},
+        ]
+
+        def stitch(kwargs):
+            # the matching uses opencv's random number generator of the thread
+            cv.setRNGSeed(0)
+            return Stitcher(**kwargs).stitch(imgs)
+
+        expected = [stitch(kwargs) for kwargs in settings]
+        with ThreadPoolExecutor(4) as executor:
+            results = list(executor.map(stitch, settings * 3))
+
+        for result, reference in zip(results, expected * 3):
+            np.testing.assert_array_equal(result, reference)
+
+    def test_stitcher_seam_resolution(self):
+        imgs = [test_input("s1.jpg"), test_input("s2.jpg")]
+        cameras = self.estimate_full_resolution_cameras(Stitcher(), imgs)
+        reference = Stitcher().stitch(imgs, cameras=cameras)
+
+        result = Stitcher(seam_megapix=0.1).stitch(imgs, cameras=cameras)
+        np.testing.assert_array_equal(result, reference)
+
+        stitcher = Stitcher(seam_megapix=0.3)
+        result = stitcher.stitch(imgs, cameras=cameras)
+        self.assertEqual(result.shape, reference.shape)
+        ratio = stitcher.images.get_ratio(Images.Resolution.LOW, Images.Resolution.SEAM)
+        self.assertAlmostEqual(ratio, np.sqrt(3))
+
+    def test_warp_and_crop_final_resolution(self):
+        for imgs in (
+            [test_input("s1.jpg"), test_input("s2.jpg")],
+            [test_input(f"weir_{i}.jpg") for i in range(1, 4)],
+        ):
+            for stitcher_class in (Stitcher, AffineStitcher):
+                stitcher = stitcher_class()
+                cameras = self.estimate_full_resolution_cameras(stitcher, imgs)
+                stitcher.stitch(imgs, cameras=cameras)
+                cameras = stitcher.perform_wave_correction(
+                    stitcher.scale_given_camera_parameters(cameras)
+                )
+
+                final_imgs = list(stitcher.resize_final_resolution())
+                result = stitcher.warp_and_crop_final_resolution(final_imgs, cameras)
+                warped = stitcher.warp_final_resolution(final_imgs, cameras)
+                reference = stitcher.crop_final_resolution(*map(list, warped))
+
+                for results, references in zip(result, reference):
+                    for value, expected in zip(results, references):
+                        np.testing.assert_array_equal(value, expected)
+
+    def test_stitcher_tiled_blending(self):
+        imgs = [test_input("s1.jpg"), test_input("s2.jpg")]
+        cameras = self.estimate_full_resolution_cameras(Stitcher(), imgs)
+        for blender_type in ("multiband", "feather"):
+            stitcher = Stitcher(blender_type=blender_type)
+            reference = stitcher.stitch(imgs, cameras=cameras)
+
+            stitcher = Stitcher(blender_type=blender_type, blend_tile_size=256)
+            result = stitcher.stitch(imgs, cameras=cameras)
+            self.assertEqual(result.shape, reference.shape)
+            max_difference = np.abs(result.astype(int) - reference).max()
+            self.assertLessEqual(max_difference, 1)
+
+            stitcher = Stitcher(
+                blender_type=blender_type,
+                blend_tile_size=256,
+                blend_in_memory=True,
+                nr_workers=2,
+            )
+            np.testing.assert_array_equal(
+                stitcher.stitch(imgs, cameras=cameras), result
+            )
+
+    def test_stitcher_adjustment_report(self):
+        imgs = [test_input("s1.jpg"), test_input("s2.jpg")]
+        cv.setRNGSeed(0)
+        stitcher = Stitcher()
+        stitcher.stitch(imgs)
+        report = stitcher.adjustment_report
+        self.assertIsNone(report.steps)
+        self.assertLess(report.final_error, 5)
+        self.assertGreater(report.elapsed, 0)
+        unbudgeted_error = report.final_error
+
+        cv.setRNGSeed(0)
+        stitcher = Stitcher(adjuster_time_budget=10, adjuster_max_iterations=5)
+        stitcher.stitch(imgs)
+        report = stitcher.adjustment_report
+        self.assertTrue(0 <= report.steps <= 2)
+        self.assertLessEqual(report.final_error, report.initial_error)
+        # the solver is restarted every step, so the cameras differ from an
+        # adjustment without budget, but not their error
+        self.assertLess(report.final_error, 5)
+        self.assertLess(abs(report.final_error - unbudgeted_error), 1)
+
     def test_stitcher_boat_aquaduct_subset(self):
         graph = test_output("boat_subset_matches_graph.txt")
         settings = {"final_megapix": 1, "matches_graph_dot_file": graph}
@@ -184,6 +306,17 @@ class TestStitcher(unittest.TestCase):
 
         self.stitch_test(stitcher, imgs, expected_shape, max_derivation, name)
 
+    def test_translation_stitcher(self):
+        img = load_test_img("weir_1.jpg")
+        imgs = [img[:400, :450], img[40:440, 200:650], img[20:420, 400:850]]
+        stitcher = TranslationStitcher(crop=False, blender_type="no")
+
+        result = stitcher.stitch(imgs)
+
+        np.testing.assert_allclose(result.shape[:2], (440, 850), atol=2)
+        difference = cv.absdiff(result[100:300, 100:700], img[100:300, 100:700])
+        self.assertLess(np.mean(difference), 5)
+
     def test_stitcher_feature_masks(self):
         stitcher = Stitcher(crop=False)
 
@@ -205,6 +338,44 @@ class TestStitcher(unittest.TestCase):
             stitcher, imgs, expected_shape, max_derivation, name, feature_masks=masks
         )
 
+    def test_stitcher_with_given_cameras(self):
+        imgs = [test_input("s1.jpg"), test_input("s2.jpg")]
+        for stitcher_class in (Stitcher, AffineStitcher):
+            # the matching is random, the cameras of the reference are given
+            cv.setRNGSeed(0)
+            stitcher = stitcher_class(crop=False)
+            reference = stitcher.stitch(imgs)
+            cv.setRNGSeed(0)
+            cameras = self.estimate_full_resolution_cameras(stitcher, imgs)
+
+            stitcher = stitcher_class(crop=False)
+            stitcher.find_features = None  # registration must be skipped
+            result = stitcher.stitch(imgs, cameras=cameras)
+            np.testing.assert_allclose(result.shape, reference.shape, atol=1)
+
+            cv.setRNGSeed(0)
+            stitcher = stitcher_class(crop=False, refine_given_cameras=True)
+            result = stitcher.stitch(imgs, cameras=cameras)
+            np.testing.assert_allclose(result.shape, reference.shape, atol=1)
+
+        with self.assertRaises(StitchingError) as cm:
+            Stitcher().stitch(imgs, cameras=cameras[:1])
+        self.assertTrue(str(cm.exception).startswith("1 cameras given for 2 images"))
+
+    @staticmethod
+    def estimate_full_resolution_cameras(stitcher, imgs):
+        stitcher.images = Images.of(imgs)
+        medium_imgs = stitcher.resize_medium_resolution()
+        features = stitcher.find_features(medium_imgs)
+        matches = stitcher.match_features(features)
+        cameras = stitcher.estimate_camera_parameters(features, matches)
+        cameras = stitcher.refine_camera_parameters(features, matches, cameras)
+        cameras = stitcher.perform_wave_correction(cameras)
+        medium_scale = stitcher.images.get_scale(Images.Resolution.MEDIUM)
+        return CameraLoader.rescale(
+            cameras, 1 / medium_scale, stitcher.warper.warper_type == "affine"
+        )
+
     def stitch_test(
         self,
         stitcher,
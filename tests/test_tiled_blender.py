@@ -0,0 +1,115 @@
+import gc
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import cv2 as cv
+import numpy as np
+
+from .context import Blender, TiledBlender
+
+
+def create_images():
+    rng = np.random.default_rng(0)
+    imgs, masks = [], []
+    for _ in range(4):
+        img = (rng.random((200, 250, 3)) * 255).astype(np.uint8)
+        imgs.append(cv.GaussianBlur(img, (15, 15), 0))
+        mask = np.zeros((200, 250), np.uint8)
+        cv.ellipse(mask, (125, 100), (120, 95), 0, 0, 360, 255, -1)
+        masks.append(mask)
+    corners = [(0, 0), (175, 15), (350, -10), (100, 150)]
+    sizes = [(250, 200)] * 4
+    return imgs, masks, corners, sizes
+
+
+def blend(blender, imgs, masks, corners, sizes):
+    blender.prepare(corners, sizes)
+    for img, mask, corner in zip(imgs, masks, corners):
+        blender.feed(img, mask, corner)
+    return blender.blend()
+
+
+class TestTiledBlender(unittest.TestCase):
+    def test_tiled_blending(self):
+        imgs, masks, corners, sizes = create_images()
+        for blender_type in Blender.BLENDER_CHOICES:
+            expected, expected_mask = blend(
+                Blender(blender_type), imgs, masks, corners, sizes
+            )
+            for tile_size in (64, 150, 1000):
+                blender = TiledBlender(blender_type, tile_size=tile_size)
+                panorama, mask = blend(blender, imgs, masks, corners, sizes)
+
+                np.testing.assert_array_equal(mask, expected_mask)
+                if blender_type == "multiband":
+                    np.testing.assert_allclose(panorama, expected, atol=1)
+                else:
+                    np.testing.assert_array_equal(panorama, expected)
+
+    def test_parallel_tiled_blending_in_memory(self):
+        imgs, masks, corners, sizes = create_images()
+        expected, expected_mask = blend(
+            TiledBlender(tile_size=64), imgs, masks, corners, sizes
+        )
+
+        blender = TiledBlender(tile_size=64, in_memory=True, nr_workers=3)
+        panorama, mask = blend(blender, imgs, masks, corners, sizes)
+
+        self.assertNotIsInstance(panorama, np.memmap)
+        self.assertIsNone(blender.tmp)
+        np.testing.assert_array_equal(panorama, expected)
+        np.testing.assert_array_equal(mask, expected_mask)
+
+    def test_blended_regions_are_bounded_by_tile_size(self):
+        imgs, masks, corners, sizes = create_images()
+        for blender_type in Blender.BLENDER_CHOICES:
+            blender = TiledBlender(blender_type, tile_size=64)
+            with patch.object(
+                Blender, "prepare_roi", autospec=True, side_effect=Blender.prepare_roi
+            ) as prepare_roi:
+                blend(blender, imgs, masks, corners, sizes)
+
+            # the tile, the margins covering the transitions and the
+            # alignment to the pyramids of the multiband blender
+            margin = int(np.ceil(blender.blend_width))
+            step = 1 << max(int(np.log2(blender.blend_width) - 1), 0)
+            max_size = 64 + 2 * margin + step
+            regions = [call.args[1] for call in prepare_roi.call_args_list]
+            self.assertGreater(len(regions), 1)
+            for region in regions:
+                self.assertLessEqual(region.width, max_size)
+                self.assertLessEqual(region.height, max_size)
+
+    def test_temporary_files(self):
+        imgs, masks, corners, sizes = create_images()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            blender = TiledBlender(tile_size=100, tmp_dir=tmp_dir)
+            panorama, mask = blend(blender, imgs, masks, corners, sizes)
+            self.assertIsInstance(panorama, np.memmap)
+            self.assertIsNone(blender.tmp)
+            self.assertEqual(len(os.listdir(tmp_dir)), 2)
+
+            # the panorama outlives the next blending
+            expected = np.array(panorama)
+            blend(blender, imgs[:2], masks[:2], corners[:2], sizes[:2])
+            np.testing.assert_array_equal(panorama, expected)
+            self.assertEqual(len(os.listdir(tmp_dir)), 2)
+
+            # its file is removed with the last view of it
+            row = panorama[10]
+            del panorama, mask
+            gc.collect()
+            self.assertEqual(len(os.listdir(tmp_dir)), 1)
+            del row
+            gc.collect()
+            self.assertEqual(os.listdir(tmp_dir), [])
+
+
+def start_test():
+    unittest.main()
+
+
+if __name__ == "__main__":
+    start_test()
@@ -0,0 +1,105 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2 as cv
+import numpy as np
+
+from .context import CameraLoader, Warper
+
+K = [[400.0, 0.0, 160.0], [0.0, 400.0, 120.0], [0.0, 0.0, 1.0]]
+R = [[0.995, 0.0, 0.0998], [0.0, 1.0, 0.0], [-0.0998, 0.0, 0.995]]
+H = [[1.0, 0.05, 10.0], [0.02, 1.0, 5.0]]
+
+
+class TestWarper(unittest.TestCase):
+    def test_warp_image_and_mask(self):
+        img = np.random.default_rng(0).integers(0, 255, (240, 320, 3), np.uint8)
+        size = (320, 240)
+        cameras = {
+            "spherical": CameraLoader.from_intrinsics_and_rotations([K], [R])[0],
+            "plane": CameraLoader.from_intrinsics_and_rotations([K], [R])[0],
+            "affine": CameraLoader.from_homographies([H])[0],
+        }
+        for warper_type, camera in cameras.items():
+            warper = Warper(warper_type)
+            warper.set_scale([camera])
+            warped_img, warped_mask = warper.warp_image_and_mask(img, camera)
+
+            np.testing.assert_array_equal(warped_img, warper.warp_image(img, camera))
+            _, reference_mask = warper.get_warper().warp(
+                np.full((240, 320), 255, np.uint8),
+                Warper.get_K(camera),
+                camera.R,
+                cv.INTER_NEAREST,
+                cv.BORDER_CONSTANT,
+            )
+            np.testing.assert_array_equal(warped_mask, reference_mask)
+            np.testing.assert_array_equal(
+                warper.create_and_warp_mask(size, camera), reference_mask
+            )
+            roi = warper.warp_roi(size, camera)
+            self.assertEqual(warped_mask.shape, (roi[3], roi[2]))
+
+    def test_warp_image_and_mask_within_rectangle(self):
+        img = np.random.default_rng(0).integers(0, 255, (240, 320, 3), np.uint8)
+        cameras = {
+            "spherical": CameraLoader.from_intrinsics_and_rotations([K], [R])[0],
+            "plane": CameraLoader.from_intrinsics_and_rotations([K], [R])[0],
+            "affine": CameraLoader.from_homographies([H])[0],
+        }
+        for warper_type, camera in cameras.items():
+            warper = Warper(warper_type)
+            warper.set_scale([camera])
+            warped_img, warped_mask = warper.warp_image_and_mask(img, camera, 0.5)
+
+            # rectangles are clipped to the warped image like slices
+            height, width = warped_mask.shape
+            for x, y, w, h in ((10, 20, 100, 50), (5, 7, width, height)):
+                cropped_img, cropped_mask = warper.warp_image_and_mask(
+                    img, camera, 0.5, (x, y, w, h)
+                )
+                np.testing.assert_array_equal(
+                    cropped_img, warped_img[y : y + h, x : x + w]
+                )
+                np.testing.assert_array_equal(
+                    cropped_mask, warped_mask[y : y + h, x : x + w]
+                )
+
+    def test_parallel_warping(self):
+        imgs = [
+            np.random.default_rng(i).integers(0, 255, (240, 320, 3), np.uint8)
+            for i in range(5)
+        ]
+        cameras = CameraLoader.from_intrinsics_and_rotations([K] * 5, [R] * 5)
+        warper = Warper()
+        warper.set_scale(cameras)
+        parallel_warper = Warper(nr_workers=3)
+        parallel_warper.set_scale(cameras)
+
+        results = warper.warp_images_and_masks(imgs, cameras, 0.5)
+        parallel_results = parallel_warper.warp_images_and_masks(imgs, cameras, 0.5)
+        for (img, mask), (parallel_img, parallel_mask) in zip(
+            results, parallel_results
+        ):
+            np.testing.assert_array_equal(img, parallel_img)
+            np.testing.assert_array_equal(mask, parallel_mask)
+
+    def test_warpers_are_reused(self):
+        camera = CameraLoader.from_intrinsics_and_rotations([K], [R])[0]
+        warper = Warper()
+        warper.set_scale([camera])
+
+        self.assertIs(warper.get_warper(), warper.get_warper())
+        self.assertIsNot(warper.get_warper(0.5), warper.get_warper())
+        with ThreadPoolExecutor(1) as executor:
+            thread_warper = executor.submit(warper.get_warper).result()
+        self.assertIsNot(thread_warper, warper.get_warper())
+        self.assertEqual(len(warper.local.warpers), 2)
+
+
+def start_test():
+    unittest.main()
+
+
+if __name__ == "__main__":
+    start_test()